@@ -0,0 +1,9 @@
+import json
+from pathlib import Path
+
+def iter_examples(base="examples"):
+    """(patient_id, FHIR bundle, notes) for each bundled example patient; notes are "" when the file is missing."""
+    base = Path(base)
+    for pfile in sorted((base / "patients").glob("*.json")):
+        nfile = base / "notes" / f"{pfile.stem}.txt"
+        yield pfile.stem, json.loads(pfile.read_text()), nfile.read_text() if nfile.exists() else ""
@@ -0,0 +1,67 @@
+
+import argparse, statistics, time
+from sqlalchemy import text
+from src.app.services.db import make_engine
+
+KNN = """
+SELECT nct_id FROM trials
+ORDER BY embedding <=> :v
+LIMIT :k
+"""
+
+def _timed(con, v, k):
+    t0 = time.perf_counter()
+    ids = [r[0] for r in con.execute(text(KNN), {"v": v, "k": k})]
+    return ids, (time.perf_counter() - t0) * 1000
+
+def main():
+    p = argparse.ArgumentParser(description="Recall@k and latency of the ANN index vs an exact scan")
+    p.add_argument("--queries", type=int, default=50, help="number of stored trial vectors used as queries")
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--ef_search", type=str, default="10,20,40,100,200", help="HNSW ef_search values to sweep")
+    p.add_argument("--probes", type=str, default="1,5,10,20", help="IVFFlat probes values to sweep")
+    args = p.parse_args()
+
+    engine = make_engine()
+    with engine.connect() as con:
+        n = con.execute(text("SELECT count(*) FROM trials")).scalar_one()
+        idx = con.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'trials' AND indexdef ILIKE '%embedding%'"
+        )).scalars().all()
+        queries = con.execute(text(
+            "SELECT embedding FROM trials WHERE embedding IS NOT NULL ORDER BY random() LIMIT :n"
+        ), {"n": args.queries}).scalars().all()
+        con.commit()
+        print(f"trials={n} indexes={idx or 'none'} queries={len(queries)} k={args.k}")
+        if not queries:
+            return
+
+        # ground truth: index scans disabled -> exact sequential scan
+        truth, exact_ms = [], []
+        with con.begin():
+            con.execute(text("SET LOCAL enable_indexscan = off"))
+            for v in queries:
+                ids, ms = _timed(con, v, args.k)
+                truth.append(set(ids))
+                exact_ms.append(ms)
+        print(f"{'exact':>16}  recall@k=1.000  mean={statistics.mean(exact_ms):7.2f}ms  "
+              f"p95={sorted(exact_ms)[int(0.95 * (len(exact_ms) - 1))]:7.2f}ms")
+
+        sweeps = []
+        if any("hnsw" in i for i in idx):
+            sweeps += [("hnsw.ef_search", int(x)) for x in args.ef_search.split(",") if x]
+        if any("ivfflat" in i for i in idx):
+            sweeps += [("ivfflat.probes", int(x)) for x in args.probes.split(",") if x]
+        for guc, val in sweeps:
+            recalls, lat = [], []
+            with con.begin():
+                con.execute(text(f"SET LOCAL {guc} = {val}"))
+                for v, t in zip(queries, truth):
+                    ids, ms = _timed(con, v, args.k)
+                    recalls.append(len(t & set(ids)) / max(1, len(t)))
+                    lat.append(ms)
+            print(f"{guc + '=' + str(val):>16}  recall@k={statistics.mean(recalls):.3f}  "
+                  f"mean={statistics.mean(lat):7.2f}ms  p95={sorted(lat)[int(0.95 * (len(lat) - 1))]:7.2f}ms")
+
+if __name__ == "__main__":
+    main()
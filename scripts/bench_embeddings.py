@@ -0,0 +1,57 @@
+
+import argparse, time
+import numpy as np
+from src.app.data.patient_extract import build_patient_profile, summarize_profile
+from scripts._examples import iter_examples
+
+def _corpus(n):
+    """Example patient summaries and note paragraphs, repeated up to n texts (short and long inputs)."""
+    texts = []
+    for _, bundle, notes in iter_examples():
+        texts.append(summarize_profile(build_patient_profile(bundle, notes)))
+        texts += [p for p in notes.split("\n\n") if p.strip()]
+    return (texts * (n // max(1, len(texts)) + 1))[:n]
+
+def _bench(name, model, texts, batch_size):
+    model.encode(texts[:8], normalize_embeddings=True)  # warm-up
+    t0 = time.perf_counter()
+    v = np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=batch_size), dtype=np.float32)
+    dt = time.perf_counter() - t0
+    print(f"{name:>10}: {len(texts) / dt:8.1f} sentences/s")
+    return v
+
+def main():
+    p = argparse.ArgumentParser(description="Throughput and cosine drift of the ONNX backends vs sentence-transformers, "
+                                            "or throughput scaling of the multi-process embedding pool")
+    p.add_argument("--n", type=int, default=2000)
+    p.add_argument("--batch_size", type=int, default=32)
+    p.add_argument("--workers", type=str, default=None,
+                   help="e.g. 1,2,4,8: measure ingest-pool throughput scaling instead of comparing backends")
+    args = p.parse_args()
+
+    if args.workers:
+        from src.app.data.embeddings import encode_uncached
+        texts = _corpus(args.n)
+        base = None
+        for w in [int(x) for x in args.workers.split(",") if x]:
+            encode_uncached(texts[:w * args.batch_size], workers=w, batch_size=args.batch_size)  # start + warm pool
+            t0 = time.perf_counter()
+            encode_uncached(texts, workers=w, batch_size=args.batch_size)
+            rate = len(texts) / (time.perf_counter() - t0)
+            base = base or rate
+            print(f"workers={w:>2}: {rate:8.1f} sentences/s  ({rate / base:.2f}x)")
+        return
+
+    from sentence_transformers import SentenceTransformer
+    from src.app.config import EMBEDDING_MODEL
+    from src.app.data.onnx_backend import OnnxEncoder
+
+    texts = _corpus(args.n)
+    ref = _bench("torch", SentenceTransformer(EMBEDDING_MODEL), texts, args.batch_size)
+    for name, quantized in [("onnx", False), ("onnx-int8", True)]:
+        v = _bench(name, OnnxEncoder(quantized=quantized), texts, args.batch_size)
+        cos = (ref * v).sum(axis=1)  # both sides are unit-normalized
+        print(f"{'':>10}  cosine vs torch: mean={cos.mean():.5f} min={cos.min():.5f}")
+
+if __name__ == "__main__":
+    main()
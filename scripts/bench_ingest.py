@@ -0,0 +1,47 @@
+
+import argparse, time
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from src.app.config import EMBEDDING_DIM
+from src.app.data.ctgov_ingest import _prepare_rows, _write_rows, _write_rows_copy
+from src.app.services.db import db_init, get_engine
+
+def _synthetic_studies(n, start):
+    criteria = "Inclusion Criteria:\n* Age >= 18\n* ECOG 0-1\n* Measurable disease\n" * 20
+    return [{
+        "protocolSection": {
+            "identificationModule": {"nctId": f"NCTBENCH{start + i:07d}", "briefTitle": f"Benchmark trial {i}"},
+            "conditionsModule": {"conditions": ["Lymphoma"]},
+            "eligibilityModule": {"eligibilityCriteria": criteria, "sex": "ALL", "minimumAge": "18 Years"},
+            "contactsLocationsModule": {"locations": [{"city": "Boston", "state": "Massachusetts", "country": "United States"}]},
+        }
+    } for i in range(n)]
+
+def main():
+    p = argparse.ArgumentParser(description="Write throughput (rows/s) of the row-by-row vs COPY upsert paths")
+    p.add_argument("--rows", type=int, default=5000)
+    p.add_argument("--batch_size", type=int, default=200)
+    args = p.parse_args()
+
+    db_init()
+    Session = sessionmaker(bind=get_engine(), future=True)
+    rng = np.random.default_rng(0)
+    # embeddings are precomputed so only the write path is timed
+    _, rows = _prepare_rows(_synthetic_studies(args.rows, 0))
+    vecs = rng.standard_normal((len(rows), EMBEDDING_DIM)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+
+    with Session() as s:
+        for name, write in [("insert", _write_rows), ("copy", _write_rows_copy)]:
+            for label in ("fresh", "update"):  # second pass exercises ON CONFLICT DO UPDATE
+                t0 = time.perf_counter()
+                for i in range(0, len(rows), args.batch_size):
+                    write(s, rows[i:i + args.batch_size], vecs[i:i + args.batch_size])
+                dt = time.perf_counter() - t0
+                print(f"{name:>6} {label:>6}: {len(rows)} rows in {dt:6.2f}s = {len(rows) / dt:8.0f} rows/s")
+            s.execute(text("DELETE FROM trials WHERE nct_id LIKE 'NCTBENCH%'"))
+            s.commit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+
+import argparse, statistics, threading, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from scripts._examples import iter_examples
+
+def _bodies(top_k, explain):
+    return [{"patient_fhir": bundle, "notes": notes, "top_k": top_k, "explain": explain}
+            for _, bundle, notes in iter_examples()]
+
+def main():
+    p = argparse.ArgumentParser(description="Closed-loop load test of POST /match/patient")
+    p.add_argument("--url", type=str, default="http://localhost:8000")
+    p.add_argument("--concurrency", type=int, default=50)
+    p.add_argument("--duration", type=float, default=30, help="seconds")
+    p.add_argument("--top_k", type=int, default=10)
+    p.add_argument("--explain", action="store_true", help="include LLM rationales (off: measures embed + SQL + scoring)")
+    p.add_argument("--label", type=str, default="", help="tag printed with the result, e.g. 'before'/'after'")
+    args = p.parse_args()
+
+    bodies = _bodies(args.top_k, args.explain)
+    lat, codes, lock = [], Counter(), threading.Lock()
+    end = time.monotonic() + args.duration
+
+    def client(i):
+        http = requests.Session()
+        n = i
+        while time.monotonic() < end:
+            t0 = time.perf_counter()
+            try:
+                code = http.post(f"{args.url}/match/patient", json=bodies[n % len(bodies)], timeout=300).status_code
+            except requests.RequestException:
+                code = "error"
+            ms = (time.perf_counter() - t0) * 1000
+            with lock:
+                codes[code] += 1
+                if code == 200:
+                    lat.append(ms)
+            n += 1
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        list(ex.map(client, range(args.concurrency)))
+    elapsed = time.monotonic() - t0
+
+    lat.sort()
+    pct = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] if lat else float("nan")
+    print(f"{args.label or 'run'}: {args.concurrency} clients x {elapsed:.0f}s -> {len(lat) / elapsed:.1f} req/s ok; "
+          f"status {dict(codes)}")
+    if lat:
+        print(f"    latency ms: mean={statistics.mean(lat):.0f} p50={pct(0.5):.0f} p95={pct(0.95):.0f} p99={pct(0.99):.0f}")
+
+if __name__ == "__main__":
+    main()
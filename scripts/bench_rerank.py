@@ -0,0 +1,56 @@
+
+import argparse, statistics, time
+import numpy as np
+from sqlalchemy import text
+from src.app.data.embeddings import embed_texts
+from src.app.data.patient_extract import build_patient_profile, summarize_profile
+from src.app.services.db import make_engine
+from src.app.services.matching import _DETAILS_SQL, _details, _rerank, _score_rows, retrieve
+from scripts._examples import iter_examples
+
+def _p95(xs):
+    return sorted(xs)[int(0.95 * (len(xs) - 1))]
+
+def main():
+    p = argparse.ArgumentParser(description="Latency and rank changes of retrieve-then-rerank vs candidate pool size")
+    p.add_argument("--top_k", type=int, default=10)
+    p.add_argument("--pools", type=str, default="10,50,100,200,400", help="candidate pool sizes to sweep")
+    p.add_argument("--repeat", type=int, default=5, help="timed runs per patient and pool size")
+    p.add_argument("--country", type=str, default="United States")
+    p.add_argument("--budget_ms", type=float, default=250, help="p95 budget for retrieval + rerank + details fetch")
+    args = p.parse_args()
+
+    patients = []
+    for pid, bundle, notes in iter_examples():
+        profile = build_patient_profile(bundle, notes)
+        summary = summarize_profile(profile)
+        patients.append((pid, profile, summary, np.asarray(embed_texts([summary])[0], dtype=np.float32)))
+
+    engine = make_engine()
+    with engine.connect() as con:
+        n = con.execute(text("SELECT count(*) FROM trials")).scalar_one()
+        print(f"trials={n} patients={len(patients)} top_k={args.top_k} (embedding excluded from timings)")
+        for pool in [int(x) for x in args.pools.split(",") if x]:
+            pool = max(pool, args.top_k)
+            lat, promoted, mean_score = [], [], []
+            for pid, profile, summary, vec in patients:
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    rows = retrieve(con, profile, vec, pool, country=args.country)
+                    candidates = _rerank(profile, rows, args.top_k)
+                    details = _details(con.execute(_DETAILS_SQL, {"ids": [c[0] for c in candidates]}))
+                    results, _ = _score_rows(summary, candidates, details)
+                    lat.append((time.perf_counter() - t0) * 1000)
+                # how many of the final top_k were outside the first top_k by similarity
+                first = {r[0] for r in rows[:args.top_k]}
+                promoted.append(sum(r["nct_id"] not in first for r in results))
+                if results:
+                    mean_score.append(statistics.mean(r["score"] for r in results))
+            verdict = "ok" if _p95(lat) <= args.budget_ms else "OVER BUDGET"
+            print(f"pool={pool:>4}  mean={statistics.mean(lat):7.2f}ms  p95={_p95(lat):7.2f}ms  "
+                  f"promoted/patient={statistics.mean(promoted):5.2f}  "
+                  f"mean top_k score={statistics.mean(mean_score) if mean_score else 0:.3f}  {verdict}")
+        con.commit()
+
+if __name__ == "__main__":
+    main()
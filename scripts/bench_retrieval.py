@@ -0,0 +1,65 @@
+
+import argparse, json, statistics, time
+from pathlib import Path
+import numpy as np
+from sqlalchemy import text
+from src.app.data.embeddings import embed_texts
+from src.app.data.patient_extract import build_patient_profile, summarize_profile
+from src.app.services.db import make_engine
+from src.app.services.matching import _PREFILTER, _compute_scores, _prefilter_params, lexical_query, retrieve
+from scripts._examples import iter_examples
+
+# every trial that passes the patient's prefilter, for the exhaustive rule-score oracle
+_ALL_SQL = text("SELECT nct_id, eligibility FROM trials WHERE" + _PREFILTER.format(
+    age="CAST(:age AS real)", sex="CAST(:sex AS text)", country="CAST(:country AS text)"))
+
+def _oracle(con, profile, params, n):
+    rows = con.execute(_ALL_SQL, params).fetchall()
+    texts = [(elig or {}).get("eligibilityCriteria", "") if isinstance(elig, dict) else "" for _, elig in rows]
+    scored = [(sc[0], nct_id) for (nct_id, _), sc in zip(rows, _compute_scores(profile, texts))]
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return {nct_id for _, nct_id in scored[:n]}
+
+def main():
+    p = argparse.ArgumentParser(description="Offline recall@k of vector vs hybrid retrieval on examples/patients")
+    p.add_argument("--k", type=int, default=10, help="candidates retrieved per patient")
+    p.add_argument("--relevant", type=int, default=10,
+                   help="oracle size: the top-N trials by rule score over the whole prefiltered corpus")
+    p.add_argument("--qrels", type=str, default=None,
+                   help="optional JSON {patient_id: [nct_id, ...]} of judged relevant trials, used instead of the oracle")
+    p.add_argument("--country", type=str, default="United States")
+    p.add_argument("--modes", type=str, default="vector,hybrid")
+    args = p.parse_args()
+
+    qrels = json.loads(Path(args.qrels).read_text()) if args.qrels else None
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    engine = make_engine()
+    recall = {m: [] for m in modes}
+    lat = {m: [] for m in modes}
+    with engine.connect() as con:
+        for pid, bundle, notes in iter_examples():
+            profile = build_patient_profile(bundle, notes)
+            vec = np.asarray(embed_texts([summarize_profile(profile)])[0], dtype=np.float32)
+            if qrels is not None:
+                relevant = set(qrels.get(pid, []))
+            else:
+                relevant = _oracle(con, profile, _prefilter_params(profile, args.country, None), args.relevant)
+            if not relevant:
+                continue
+            line = []
+            for m in modes:
+                t0 = time.perf_counter()
+                ids = {r[0] for r in retrieve(con, profile, vec, args.k, country=args.country, mode=m)}
+                lat[m].append((time.perf_counter() - t0) * 1000)
+                recall[m].append(len(ids & relevant) / len(relevant))
+                line.append(f"{m}={recall[m][-1]:.2f}")
+            print(f"{pid}  relevant={len(relevant):>3}  {'  '.join(line)}  terms={lexical_query(profile)}")
+        con.commit()
+
+    for m in modes:
+        if recall[m]:
+            print(f"{m:>8}  recall@{args.k}={statistics.mean(recall[m]):.3f}  mean={statistics.mean(lat[m]):7.2f}ms  "
+                  f"patients={len(recall[m])}")
+
+if __name__ == "__main__":
+    main()
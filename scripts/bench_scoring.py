@@ -0,0 +1,54 @@
+
+import argparse, statistics, time
+from pathlib import Path
+from sqlalchemy import text
+from src.app.data.patient_extract import build_patient_profile
+from src.app.services.matching import _compute_score, _compute_scores
+from scripts._examples import iter_examples
+
+def _profiles():
+    for pid, bundle, notes in iter_examples():
+        yield pid, build_patient_profile(bundle, notes)
+
+def _texts(source, n):
+    if source == "db":
+        from src.app.services.db import make_engine
+
+        with make_engine().connect() as con:
+            return con.execute(text(
+                "SELECT eligibility->>'eligibilityCriteria' FROM trials ORDER BY nct_id LIMIT :n"
+            ), {"n": n}).scalars().all()
+    # no database: the example notes, repeated, stand in for criteria text
+    notes = [p.read_text() for p in sorted(Path("examples/notes").glob("*.txt"))]
+    return [notes[i % len(notes)] for i in range(n)]
+
+def main():
+    p = argparse.ArgumentParser(description="Check batch scoring matches _compute_score exactly and time both")
+    p.add_argument("--n", type=int, default=200, help="eligibility texts per patient (the candidate pool size)")
+    p.add_argument("--source", choices=["db", "examples"], default="db")
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    texts = _texts(args.source, args.n)
+    print(f"texts={len(texts)} source={args.source}")
+    scalar_ms, batch_ms, mismatches = [], [], 0
+    for pid, profile in _profiles():
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            expected = [_compute_score(profile, t or "") for t in texts]
+            t1 = time.perf_counter()
+            got = _compute_scores(profile, texts)
+            t2 = time.perf_counter()
+            scalar_ms.append((t1 - t0) * 1000)
+            batch_ms.append((t2 - t1) * 1000)
+        bad = [i for i, (a, b) in enumerate(zip(expected, got)) if a != b]
+        mismatches += len(bad)
+        if bad:
+            i = bad[0]
+            print(f"{pid}: {len(bad)} mismatches, first at {i}: {expected[i]} != {got[i]}")
+    s, b = statistics.mean(scalar_ms), statistics.mean(batch_ms)
+    print(f"per-row mean={s:8.2f}ms  batch mean={b:8.2f}ms  speedup={s / b if b else 0:5.1f}x  "
+          f"{'identical' if not mismatches else f'{mismatches} MISMATCHES'}")
+
+if __name__ == "__main__":
+    main()
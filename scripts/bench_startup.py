@@ -0,0 +1,36 @@
+
+import argparse, statistics, subprocess, sys
+
+HEAVY = ["torch", "sentence_transformers", "transformers", "onnxruntime", "rapidfuzz", "dateparser", "requests"]
+
+def _importtime(module):
+    """Run `python -X importtime -c 'import module'` in a fresh interpreter; return {module: (self_us, cumulative_us)}."""
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                       capture_output=True, text=True, check=True)
+    out = {}
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = [x.strip() for x in line[len("import time:"):].split("|")]
+        out[name.strip()] = (int(self_us), int(cum_us))
+    return out
+
+def main():
+    p = argparse.ArgumentParser(description="Cold import time of the API and CLI entry points (python -X importtime)")
+    p.add_argument("modules", nargs="*", default=["src.app.main", "scripts.init_db", "scripts.load_ctgov"])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--top", type=int, default=10)
+    args = p.parse_args()
+
+    for module in args.modules:
+        runs = [_importtime(module) for _ in range(args.repeat)]
+        totals = [r[module][1] / 1000 for r in runs]
+        last = runs[-1]
+        heavy = [m for m in HEAVY if m in last]
+        print(f"{module}: median {statistics.median(totals):.1f}ms over {args.repeat} runs; "
+              f"heavy deps imported: {', '.join(heavy) or 'none'}")
+        for name, (self_us, cum_us) in sorted(last.items(), key=lambda kv: -kv[1][0])[:args.top]:
+            print(f"    {self_us / 1000:8.1f}ms self  {cum_us / 1000:8.1f}ms cumulative  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+
+import argparse, time
+from src.app.config import VECTOR_INDEX
+from src.app.services.db import make_engine, rebuild_vector_index
+
+def main():
+    p = argparse.ArgumentParser(description="(Re)build the ANN index on trials.embedding, e.g. after a bulk load")
+    p.add_argument("--method", type=str, default=VECTOR_INDEX, choices=["hnsw", "ivfflat", "none"])
+    p.add_argument("--m", type=int, default=None, help="HNSW max connections per layer")
+    p.add_argument("--ef_construction", type=int, default=None, help="HNSW build-time candidate list size")
+    p.add_argument("--lists", type=int, default=None, help="IVFFlat list count (rule of thumb: rows / 1000)")
+    p.add_argument("--concurrently", action="store_true", help="build without blocking writes")
+    args = p.parse_args()
+
+    engine = make_engine()
+    t0 = time.perf_counter()
+    rebuild_vector_index(engine, method=args.method, m=args.m, ef_construction=args.ef_construction,
+                         lists=args.lists, concurrently=args.concurrently)
+    print(f"Rebuilt {args.method} index in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
 
-import argparse
-from sqlalchemy import create_engine
+import argparse, os, time
 from sqlalchemy.orm import sessionmaker
-from src.app.config import DATABASE_URL
-from src.app.data.ctgov_ingest import fetch_trials, upsert_trials
+from src.app.data.ctgov_ingest import iter_trial_pages, ingest_pages
+from src.app.services.db import make_engine
+from src.app.services.trials import sync_trials_incremental
 
 def main():
     p = argparse.ArgumentParser()
@@ -13,17 +13,52 @@ def main():
     p.add_argument("--state", type=str, default=None)
     p.add_argument("--statuses", type=str, default="RECRUITING,NOT_YET_RECRUITING")
     p.add_argument("--page_size", type=int, default=100)
-    p.add_argument("--max_pages", type=int, default=1)
+    p.add_argument("--max_pages", type=int, default=None,
+                   help="pages to fetch (default 1; with --incremental, TRIAL_SYNC_MAX_PAGES)")
+    p.add_argument("--checkpoint", type=str, default=None,
+                   help="page-token checkpoint used to resume an interrupted load ('' to disable; default "
+                        ".ctgov_checkpoint.json, none with --incremental, which resumes from its high-water mark)")
+    p.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    p.add_argument("--batch_size", type=int, default=None, help="rows per embed/write batch")
+    p.add_argument("--bulk", action="store_true", help="write batches with binary COPY + one merge statement")
+    p.add_argument("--force", action="store_true", help="re-embed and rewrite studies even if unchanged")
+    p.add_argument("--incremental", action="store_true",
+                   help="only fetch studies updated since the last sync; drop ones no longer in --statuses")
+    p.add_argument("--since", type=str, default=None, help="override the incremental high-water mark (YYYY-MM-DD)")
+    p.add_argument("--interval", type=float, default=None,
+                   help="with --incremental: keep running and sync every N minutes (for a cron-less schedule)")
     args = p.parse_args()
 
     statuses = [s.strip() for s in args.statuses.split(",") if s.strip()]
-    engine = create_engine(DATABASE_URL, future=True)
+    if args.checkpoint is None and not args.incremental:
+        args.checkpoint = ".ctgov_checkpoint.json"
+    if args.restart and args.checkpoint:
+        if os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+    engine = make_engine()
     Session = sessionmaker(bind=engine, future=True)
+    if args.incremental:
+        while True:
+            with Session() as s:
+                stats = sync_trials_incremental(s, cond=args.cond, terms=args.terms, country=args.country,
+                                                state=args.state, statuses=statuses, since=args.since,
+                                                page_size=args.page_size, max_pages=args.max_pages,
+                                                checkpoint_path=args.checkpoint or None, bulk=args.bulk)
+            print(f"Synced since {stats['since'] or 'the beginning'}: {stats['written']} written "
+                  f"({stats['embedded']} embedded, {stats['unchanged']} unchanged), {stats['removed']} removed; "
+                  f"high-water mark {stats['high_water_mark']}{'' if stats['complete'] else ' (partial, resumes next run)'}")
+            if not args.interval:
+                return
+            args.since = None
+            time.sleep(args.interval * 60)
+
     with Session() as s:
-        trials = fetch_trials(cond=args.cond, terms=args.terms, country=args.country, state=args.state,
-                              statuses=statuses, page_size=args.page_size, max_pages=args.max_pages)
-        upsert_trials(s, trials)
-    print(f"Loaded {len(trials)} trials")
+        # pages stream through fetch -> embed -> upsert; nothing holds more than a few batches
+        pages = iter_trial_pages(cond=args.cond, terms=args.terms, country=args.country, state=args.state,
+                                 statuses=statuses, page_size=args.page_size, max_pages=args.max_pages or 1,
+                                 checkpoint_path=args.checkpoint or None, ack_pages=True)
+        stats = ingest_pages(s, pages, batch_size=args.batch_size, bulk=args.bulk, force=args.force)
+    print(f"Loaded {stats['written']} trials ({stats['embedded']} embedded, {stats['unchanged']} unchanged)")
 
 if __name__ == "__main__":
     main()
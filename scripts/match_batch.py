@@ -0,0 +1,50 @@
+
+import argparse, json, sys, time
+from sqlalchemy.orm import sessionmaker
+from src.app.services.batch import iter_batch_items, batch_records
+from src.app.services.db import make_engine
+from scripts._examples import iter_examples
+
+def _example_items():
+    for pid, bundle, notes in iter_examples():
+        yield {"patient_id": pid, "patient_fhir": bundle, "notes": notes}
+
+def main():
+    p = argparse.ArgumentParser(description="Match many patients and write one NDJSON line per patient")
+    p.add_argument("input", nargs="?", default=None,
+                   help="JSON array or NDJSON of bundles / {patient_fhir, notes, patient_id}; '-' for stdin; "
+                        "omit to run the bundled examples")
+    p.add_argument("--out", type=str, default="-", help="output NDJSON path ('-' for stdout)")
+    p.add_argument("--top_k", type=int, default=10)
+    p.add_argument("--cond_hint", type=str, default=None)
+    p.add_argument("--country", type=str, default="United States")
+    p.add_argument("--explain", action="store_true", help="include LLM rationales")
+    p.add_argument("--chunk_size", type=int, default=None, help="patients per embed call / retrieval query")
+    args = p.parse_args()
+
+    if args.input is None:
+        src, items = None, _example_items()
+    else:
+        src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+        items = iter_batch_items(src, lenient=True)
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+
+    Session = sessionmaker(bind=make_engine(), future=True)
+    t0, n, failed = time.perf_counter(), 0, 0
+    with Session() as s:
+        for rec in batch_records(s, items, top_k=args.top_k, cond_hint=args.cond_hint, country=args.country,
+                                 explain=args.explain, chunk_size=args.chunk_size):
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+            n += 1
+            failed += "error" in rec
+    if src not in (None, sys.stdin):
+        src.close()
+    if out is not sys.stdout:
+        out.close()
+    dt = time.perf_counter() - t0
+    print(f"Matched {n - failed} patients ({failed} failed) in {dt:.1f}s, {n / dt if dt else 0:.1f} patients/s",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
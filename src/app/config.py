@@ -9,12 +9,76 @@ POSTGRES_DB = os.getenv("POSTGRES_DB", "bond_trials")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "bond_user")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "devpassword")
 DATABASE_URL = f"postgresql+psycopg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# psycopg server-side prepares a statement after this many executions on a connection; "" disables
+# (needed behind pgbouncer in transaction mode)
+_prepare_threshold = os.getenv("DB_PREPARE_THRESHOLD", "1")
+DB_PREPARE_THRESHOLD = int(_prepare_threshold) if _prepare_threshold else None
 
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:11434")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3.1:instruct")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "20"))
+MATCH_BATCH_CHUNK = int(os.getenv("MATCH_BATCH_CHUNK", "256"))
+# cap on candidate rows (patients x pool, each with its criteria text) one batch chunk holds at once
+MATCH_BATCH_MAX_ROWS = int(os.getenv("MATCH_BATCH_MAX_ROWS", "10000"))
+# Candidates rule-scored per match before keeping top_k, ranked by
+# RERANK_SCORE_WEIGHT * score + (1 - RERANK_SCORE_WEIGHT) * vector similarity
+MATCH_CANDIDATE_POOL = int(os.getenv("MATCH_CANDIDATE_POOL", "200"))
+RERANK_SCORE_WEIGHT = float(os.getenv("RERANK_SCORE_WEIGHT", "0.7"))
+RATIONALE_CACHE_ENABLED = os.getenv("RATIONALE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RATIONALE_CACHE_TTL_HOURS = float(os.getenv("RATIONALE_CACHE_TTL_HOURS", "168"))
+RATIONALE_CACHE_MAX_ROWS = int(os.getenv("RATIONALE_CACHE_MAX_ROWS", "50000"))
 
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+# "torch" (sentence-transformers) or "onnx" (ONNX Runtime export of the same model, optionally int8-quantized)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", ".cache/onnx")
+EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_MAX_SEQ_LENGTH = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "256"))
+# Ingest-time embedding: worker processes (1 = encode in-process) and texts per encode call
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Load the embedding model and run a warm-up encode at API startup instead of on the first match
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "true").lower() in ("1", "true", "yes")
+# In-process LRU entries, and an on-disk SQLite store shared across processes ("" disables it) that keeps
+# the most recently used EMBEDDING_DISK_CACHE_MAX_ROWS vectors (~1.5 KB each)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBEDDING_DISK_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_DISK_CACHE_MAX_ROWS", "100000"))
+
+# ANN index on trials.embedding: "hnsw", "ivfflat" or "none" (exact scan)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# pgvector >= 0.8 keeps scanning the index until enough rows pass the prefilter WHERE clause:
+# "relaxed_order" (results re-sorted by the match query), "strict_order" (HNSW only) or "off"
+ANN_ITERATIVE_SCAN = os.getenv("ANN_ITERATIVE_SCAN", "relaxed_order").lower()
+# "vector" (cosine ANN only) or "hybrid" (ANN + Postgres full-text, reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+RRF_K = int(os.getenv("RRF_K", "60"))
 
 CTGOV_BASE_URL = os.getenv("CTGOV_BASE_URL", "https://beta-ut.clinicaltrials.gov/api/v2")
+CTGOV_TIMEOUT_S = float(os.getenv("CTGOV_TIMEOUT_S", "60"))
+CTGOV_MAX_RETRIES = int(os.getenv("CTGOV_MAX_RETRIES", "6"))
+CTGOV_BACKOFF_S = float(os.getenv("CTGOV_BACKOFF_S", "1.0"))
+CTGOV_MIN_INTERVAL_S = float(os.getenv("CTGOV_MIN_INTERVAL_S", "0.2"))
+CTGOV_PREFETCH_PAGES = int(os.getenv("CTGOV_PREFETCH_PAGES", "2"))
 DEFAULT_STATUSES = [s.strip() for s in os.getenv("DEFAULT_STATUSES", "RECRUITING,NOT_YET_RECRUITING").split(",") if s.strip()]
+# Query scope used for lazy/background refreshes
+TRIAL_SYNC_COND = os.getenv("TRIAL_SYNC_COND", "lymphoma")
+TRIAL_SYNC_COUNTRY = os.getenv("TRIAL_SYNC_COUNTRY", "United States")
+TRIAL_SYNC_MAX_PAGES = int(os.getenv("TRIAL_SYNC_MAX_PAGES", "50"))
+# Background incremental sync inside the API; 0 disables. "process" runs each sync in a child process
+TRIAL_REFRESH_INTERVAL_MIN = float(os.getenv("TRIAL_REFRESH_INTERVAL_MIN", "360"))
+TRIAL_REFRESH_WORKER = os.getenv("TRIAL_REFRESH_WORKER", "process").lower()
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "2"))
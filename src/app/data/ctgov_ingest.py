@@ -1,11 +1,55 @@
 
-import json
-import requests, time
+import hashlib, json, os, queue, re, threading, time
+import numpy as np
 from sqlalchemy import text
-from ..config import CTGOV_BASE_URL, DEFAULT_STATUSES
-from .embeddings import embed_texts
+from ..config import (
+    CTGOV_BASE_URL,
+    CTGOV_TIMEOUT_S,
+    CTGOV_MAX_RETRIES,
+    CTGOV_BACKOFF_S,
+    CTGOV_MIN_INTERVAL_S,
+    CTGOV_PREFETCH_PAGES,
+    DEFAULT_STATUSES,
+    INGEST_BATCH_SIZE,
+    INGEST_QUEUE_SIZE,
+    EMBEDDING_MODEL,
+    EMBEDDING_WORKERS,
+)
+from .embeddings import backend_tag, embed_texts
+from .trial_features import FEATURES_VERSION, extract_trial_features
 
-def fetch_trials(cond=None, terms=None, country=None, state=None, statuses=None, page_size=100, max_pages=1):
+# Bump when the columns derived from a study payload change, so the next ingest rewrites unchanged studies once
+# (a FEATURES_VERSION bump does the same)
+INGEST_VERSION = "3"
+
+_http = None
+_http_lock = threading.Lock()
+
+def get_http():
+    """Shared pooled session; retries 429/5xx and connection errors with exponential backoff (honours Retry-After)."""
+    global _http
+    with _http_lock:
+        if _http is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=CTGOV_MAX_RETRIES,
+                backoff_factor=CTGOV_BACKOFF_S,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["GET"]),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            s = requests.Session()
+            s.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=4))
+            s.mount("http://", HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=4))
+            _http = s
+    return _http
+
+def _query_params(cond=None, terms=None, country=None, state=None, statuses=None, page_size=100, updated_since=None,
+                  oldest_first=False):
     statuses = statuses or DEFAULT_STATUSES
     params_base = {
         "pageSize": page_size,
@@ -18,18 +62,124 @@ def fetch_trials(cond=None, terms=None, country=None, state=None, statuses=None,
         params_base["query.locn"] = f"{state}, {country}"
     elif country:
         params_base["query.locn"] = country
+    if updated_since or oldest_first:
+        # oldest first, so a run cut short by max_pages still leaves a valid high-water mark
+        params_base["sort"] = "LastUpdatePostDate:asc"
+    if updated_since:
+        # delta query: every study touched since the date, whatever its status, so status changes are seen too
+        params_base["filter.advanced"] = f"AREA[LastUpdatePostDate]RANGE[{updated_since},MAX]"
+        del params_base["filter.overallStatus"]
+    return params_base
+
+def _load_checkpoint(path, params_base):
+    if not path or not os.path.exists(path):
+        return None, 0
+    with open(path) as f:
+        ck = json.load(f)
+    if ck.get("params") != params_base:
+        return None, 0  # checkpoint belongs to a different query
+    return ck.get("page_token"), int(ck.get("pages_done", 0))
+
+def _save_checkpoint(path, params_base, page_token, pages_done):
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"params": params_base, "page_token": page_token, "pages_done": pages_done}, f)
+    os.replace(tmp, path)  # atomic, so a crash mid-write never corrupts the checkpoint
+
+def _clear_checkpoint(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def _put(out, item, stop):
+    # bounded put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+def _page_producer(params_base, page_token, pages_left, out, stop):
+    """Download pages in order (each needs the previous page's token) and hand them to the consumer."""
+    http = get_http()
+    last = 0.0
+    try:
+        for _ in range(pages_left):
+            params = dict(params_base)
+            if page_token: params["pageToken"] = page_token
+            wait_s = CTGOV_MIN_INTERVAL_S - (time.monotonic() - last)
+            if wait_s > 0:
+                time.sleep(wait_s)
+            last = time.monotonic()
+            r = http.get(f"{CTGOV_BASE_URL}/studies", params=params, timeout=CTGOV_TIMEOUT_S)
+            r.raise_for_status()
+            data = r.json()
+            page_token = data.get("nextPageToken")
+            _put(out, (data.get("studies", []), page_token), stop)
+            if stop.is_set() or not page_token:
+                break
+        _put(out, None, stop)
+    except BaseException as e:
+        _put(out, e, stop)
 
-    trials, page_token = [], None
-    for _ in range(max_pages):
-        params = dict(params_base)
-        if page_token: params["pageToken"] = page_token
-        r = requests.get(f"{CTGOV_BASE_URL}/studies", params=params, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        trials.extend(data.get("studies", []))
-        page_token = data.get("nextPageToken")
-        if not page_token: break
-        time.sleep(0.2)
+def iter_trial_pages(cond=None, terms=None, country=None, state=None, statuses=None, page_size=100, max_pages=1,
+                     checkpoint_path=None, prefetch=None, ack_pages=False, updated_since=None, oldest_first=False):
+    """
+    Yield one list of raw studies per page. Page N+1 downloads in a background thread while the caller
+    processes page N. With `checkpoint_path`, the token of the next unprocessed page is saved once a page
+    is done, so an interrupted run resumes there; the checkpoint is removed when the run finishes.
+    By default a page counts as done when the caller asks for the next one. With `ack_pages=True` the
+    generator yields `(studies, ack)` instead and the caller calls `ack()` once the page is durably stored.
+    `updated_since` (YYYY-MM-DD) restricts to studies whose lastUpdatePostDate is on/after it, in any status;
+    delta queries and `oldest_first=True` page in ascending lastUpdatePostDate order. Each ack has
+    `last_page=True` when no page follows it, i.e. the query was read to the end.
+    """
+    params_base = _query_params(cond, terms, country, state, statuses, page_size, updated_since, oldest_first)
+    page_token, pages_done = _load_checkpoint(checkpoint_path, params_base)
+    pages_left = max_pages - pages_done
+    if pages_left <= 0:
+        _clear_checkpoint(checkpoint_path)
+        return
+
+    def make_ack(next_token, n):
+        def ack():
+            if next_token and n < max_pages:
+                _save_checkpoint(checkpoint_path, params_base, next_token, n)
+            else:
+                _clear_checkpoint(checkpoint_path)
+        ack.last_page = not next_token
+        return ack
+
+    out = queue.Queue(maxsize=max(1, prefetch or CTGOV_PREFETCH_PAGES))
+    stop = threading.Event()
+    th = threading.Thread(target=_page_producer, args=(params_base, page_token, pages_left, out, stop), daemon=True)
+    th.start()
+    try:
+        while True:
+            item = out.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            studies, next_token = item
+            pages_done += 1
+            ack = make_ack(next_token, pages_done)
+            if ack_pages:
+                yield studies, ack
+            else:
+                yield studies
+                # the caller has finished with this page; only now is it safe to move the checkpoint past it
+                ack()
+    finally:
+        stop.set()
+
+def fetch_trials(cond=None, terms=None, country=None, state=None, statuses=None, page_size=100, max_pages=1):
+    trials = []
+    for studies in iter_trial_pages(cond=cond, terms=terms, country=country, state=state, statuses=statuses,
+                                    page_size=page_size, max_pages=max_pages):
+        trials.extend(studies)
     return trials
 
 def _trial_text(t):
@@ -43,42 +193,326 @@ def _trial_text(t):
     text_blob = f"{title}. Conditions: {conditions}. Eligibility: {criteria}"
     return nct_id, title, conditions, elig, text_blob
 
-def upsert_trials(session, trials):
+def study_status(t):
+    return ((t.get("protocolSection", {}).get("statusModule", {}) or {}).get("overallStatus") or "").upper()
+
+def study_last_update(t):
+    """lastUpdatePostDate as YYYY-MM-DD (month-only dates become the 1st), or None."""
+    sm = t.get("protocolSection", {}).get("statusModule", {}) or {}
+    d = (sm.get("lastUpdatePostDateStruct") or {}).get("date") or sm.get("lastUpdatePostDate")
+    if not d:
+        return None
+    return d if len(d) >= 10 else f"{d[:7]}-01"
+
+_AGE_UNITS = {"year": 1.0, "month": 1 / 12, "week": 7 / 365.25, "day": 1 / 365.25, "hour": 1 / 8766, "minute": 1 / 525960}
+
+def _age_years(s):
+    """CT.gov ages look like "18 Years" or "6 Months"; "N/A" and missing mean no bound."""
+    m = re.match(r"\s*(\d+(?:\.\d+)?)\s*(year|month|week|day|hour|minute)", (s or "").lower())
+    return round(float(m.group(1)) * _AGE_UNITS[m.group(2)], 3) if m else None
+
+def study_filters(t):
+    """Structured eligibility/location fields stored next to each trial for SQL prefiltering."""
+    ps = t.get("protocolSection", {})
+    elig = ps.get("eligibilityModule", {}) or {}
+    locations = (ps.get("contactsLocationsModule", {}) or {}).get("locations", []) or []
+    sex = (elig.get("sex") or "").upper() or None
+    hv = elig.get("healthyVolunteers")
+    return {
+        "min_age_years": _age_years(elig.get("minimumAge")),
+        "max_age_years": _age_years(elig.get("maximumAge")),
+        "sex": sex,
+        "healthy_volunteers": hv if isinstance(hv, bool) else None,
+        "overall_status": study_status(t) or None,
+        "countries": sorted({l["country"] for l in locations if l.get("country")}),
+        "states": sorted({l["state"] for l in locations if l.get("state")}),
+    }
+
+def _sha256(s):
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+def _prepare_rows(studies):
+    texts, rows = [], []
+    for t in studies:
+        nct_id, title, conditions, elig, text_blob = _trial_text(t)
+        if not nct_id:
+            continue
+        # text_hash decides whether the embedding is stale (model, backend or text changed), payload_hash whether
+        # the row and its trial_features are
+        text_hash = _sha256(f"{EMBEDDING_MODEL}\n{backend_tag()}\n{text_blob}")
+        payload_hash = _sha256(f"{INGEST_VERSION}\n{FEATURES_VERSION}\n{json.dumps(t, sort_keys=True)}")
+        texts.append(text_blob)
+        rows.append((nct_id, title, conditions, elig, t, text_hash, payload_hash))
+    return texts, rows
+
+def _plan_rows(con, texts, rows, force=False):
+    """
+    Drop rows whose stored hashes match and flag which of the rest need a new embedding.
+    Returns (rows, needs_embedding, texts_to_embed, skipped).
+    """
+    existing = {}
+    if not force and rows:
+        existing = {
+            nct_id: (th, ph)
+            for nct_id, th, ph in con.execute(
+                text("SELECT nct_id, text_hash, payload_hash FROM trials WHERE nct_id = ANY(:ids)"),
+                {"ids": [r[0] for r in rows]},
+            )
+        }
+    keep, need, to_embed, skipped = [], [], [], 0
+    for blob, row in zip(texts, rows):
+        old = existing.get(row[0])
+        if old == (row[5], row[6]):
+            skipped += 1
+            continue
+        keep.append(row)
+        need.append(old is None or old[0] != row[5])
+        if need[-1]:
+            to_embed.append(blob)
+    return keep, need, to_embed, skipped
+
+def _embed_planned(need, to_embed):
+    # None keeps the stored embedding (see COALESCE in the upserts)
+    it = iter(embed_texts(to_embed, workers=EMBEDDING_WORKERS, persist=False)) if to_embed else iter(())
+    return [next(it) if n else None for n in need]
+
+_FEATURES_SQL = text("""
+INSERT INTO trial_features (nct_id, version, norm_text, mentions_ecog, biomarkers, mentions_sex_words, exclusion_at)
+VALUES (:nct_id, :version, :norm_text, :mentions_ecog, :biomarkers, :mentions_sex_words, :exclusion_at)
+ON CONFLICT (nct_id) DO UPDATE SET
+  version = EXCLUDED.version,
+  norm_text = EXCLUDED.norm_text,
+  mentions_ecog = EXCLUDED.mentions_ecog,
+  biomarkers = EXCLUDED.biomarkers,
+  mentions_sex_words = EXCLUDED.mentions_sex_words,
+  exclusion_at = EXCLUDED.exclusion_at
+""")
+
+def _write_features(session, rows):
+    # same transaction as the trial rows, so features never describe an older criteria text
+    latest = {r[0]: r[3] for r in rows}
+    session.execute(_FEATURES_SQL, [
+        {"nct_id": nct_id, "version": FEATURES_VERSION, **extract_trial_features((elig or {}).get("eligibilityCriteria"))}
+        for nct_id, elig in latest.items()
+    ])
+
+def _write_rows(session, rows, vecs):
+    for (nct_id, title, conditions, elig, payload, text_hash, payload_hash), emb in zip(rows, vecs):
+        session.execute(text("""
+        INSERT INTO trials (nct_id, title, conditions, eligibility, locations, payload, embedding, text_hash, payload_hash,
+                            min_age_years, max_age_years, sex, healthy_volunteers, overall_status, countries, states)
+        VALUES (:nct_id, :title, :conditions, :eligibility, :locations, :payload, :embedding, :text_hash, :payload_hash,
+                :min_age_years, :max_age_years, :sex, :healthy_volunteers, :overall_status, :countries, :states)
+        ON CONFLICT (nct_id) DO UPDATE SET
+          title = EXCLUDED.title,
+          conditions = EXCLUDED.conditions,
+          eligibility = EXCLUDED.eligibility,
+          locations = EXCLUDED.locations,
+          payload = EXCLUDED.payload,
+          embedding = COALESCE(EXCLUDED.embedding, trials.embedding),
+          text_hash = EXCLUDED.text_hash,
+          payload_hash = EXCLUDED.payload_hash,
+          min_age_years = EXCLUDED.min_age_years,
+          max_age_years = EXCLUDED.max_age_years,
+          sex = EXCLUDED.sex,
+          healthy_volunteers = EXCLUDED.healthy_volunteers,
+          overall_status = EXCLUDED.overall_status,
+          countries = EXCLUDED.countries,
+          states = EXCLUDED.states
+        """),
+        {
+            "nct_id": nct_id,
+            "title": title,
+            "conditions": conditions,
+            # Serialize dicts to JSON strings so psycopg adapts them to JSONB
+            "eligibility": json.dumps(elig or {}),
+            "locations": json.dumps(payload.get("protocolSection", {}).get("contactsLocationsModule", {}) or {}),
+            "payload": json.dumps(payload or {}),
+            "embedding": np.asarray(emb, dtype=np.float32) if emb is not None else None,
+            "text_hash": text_hash,
+            "payload_hash": payload_hash,
+            **study_filters(payload),
+        })
+    _write_features(session, rows)
+    session.commit()
+
+_COPY_COLUMNS = ("nct_id, title, conditions, eligibility, locations, payload, embedding, text_hash, payload_hash, "
+                 "min_age_years, max_age_years, sex, healthy_volunteers, overall_status, countries, states")
+
+def _write_rows_copy(session, rows, vecs):
+    """
+    Bulk variant of _write_rows: binary COPY the batch into a session-local staging table, then merge it
+    into trials with a single INSERT ... SELECT ... ON CONFLICT.
+    """
+    from psycopg.types.json import Jsonb
+
+    # the vector type is registered on every pooled connection (services.db), which set_types relies on
+    conn = session.connection().connection.driver_connection
+    # last occurrence wins, as with the row-by-row path; ON CONFLICT cannot touch a row twice per statement
+    latest = {r[0]: (r, v) for r, v in zip(rows, vecs)}
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE IF NOT EXISTS trials_stage (LIKE trials INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        with cur.copy(f"COPY trials_stage ({_COPY_COLUMNS}) FROM STDIN (FORMAT BINARY)") as cp:
+            cp.set_types(["text", "text", "text", "jsonb", "jsonb", "jsonb", "vector", "text", "text",
+                          "float4", "float4", "text", "bool", "text", "text[]", "text[]"])
+            for (nct_id, title, conditions, elig, payload, text_hash, payload_hash), emb in latest.values():
+                cp.write_row((
+                    nct_id,
+                    title,
+                    conditions,
+                    Jsonb(elig or {}),
+                    Jsonb(payload.get("protocolSection", {}).get("contactsLocationsModule", {}) or {}),
+                    Jsonb(payload or {}),
+                    np.asarray(emb, dtype=np.float32) if emb is not None else None,
+                    text_hash,
+                    payload_hash,
+                    *study_filters(payload).values(),
+                ))
+        cur.execute(f"""
+        INSERT INTO trials ({_COPY_COLUMNS})
+        SELECT {_COPY_COLUMNS} FROM trials_stage
+        ON CONFLICT (nct_id) DO UPDATE SET
+          title = EXCLUDED.title,
+          conditions = EXCLUDED.conditions,
+          eligibility = EXCLUDED.eligibility,
+          locations = EXCLUDED.locations,
+          payload = EXCLUDED.payload,
+          embedding = COALESCE(EXCLUDED.embedding, trials.embedding),
+          text_hash = EXCLUDED.text_hash,
+          payload_hash = EXCLUDED.payload_hash,
+          min_age_years = EXCLUDED.min_age_years,
+          max_age_years = EXCLUDED.max_age_years,
+          sex = EXCLUDED.sex,
+          healthy_volunteers = EXCLUDED.healthy_volunteers,
+          overall_status = EXCLUDED.overall_status,
+          countries = EXCLUDED.countries,
+          states = EXCLUDED.states
+        """)
+    _write_features(session, rows)
+    session.commit()
+
+def _new_stats():
+    return {"written": 0, "embedded": 0, "unchanged": 0, "removed": 0}
+
+def upsert_trials(session, trials, batch_size=None, bulk=False, force=False):
+    """
+    Embed and upsert `trials`. Studies whose text and payload hashes match the stored row are skipped;
+    if only the payload changed the row is rewritten but the stored embedding is kept.
+    `force=True` re-embeds and rewrites everything. Returns counts of written/embedded/unchanged rows.
+    """
+    stats = _new_stats()
     if not trials:
-        return
-    batches = 200
+        return stats
+    write = _write_rows_copy if bulk else _write_rows
+    batches = batch_size or INGEST_BATCH_SIZE
     for i in range(0, len(trials), batches):
-        chunk = trials[i:i+batches]
-        vectors_text, rows = [], []
-        for t in chunk:
-            nct_id, title, conditions, elig, text_blob = _trial_text(t)
-            if not nct_id:
-                continue
-            vectors_text.append(text_blob)
-            rows.append((nct_id, title, conditions, elig, t))
+        texts, rows = _prepare_rows(trials[i:i+batches])
+        rows, need, to_embed, skipped = _plan_rows(session, texts, rows, force)
+        stats["unchanged"] += skipped
         if not rows:
             continue
-        vecs = embed_texts(vectors_text)
-        for (nct_id, title, conditions, elig, payload), emb in zip(rows, vecs):
-            session.execute(text("""
-            INSERT INTO trials (nct_id, title, conditions, eligibility, locations, payload, embedding)
-            VALUES (:nct_id, :title, :conditions, :eligibility, :locations, :payload, :embedding)
-            ON CONFLICT (nct_id) DO UPDATE SET
-              title = EXCLUDED.title,
-              conditions = EXCLUDED.conditions,
-              eligibility = EXCLUDED.eligibility,
-              locations = EXCLUDED.locations,
-              payload = EXCLUDED.payload,
-              embedding = EXCLUDED.embedding
-            """),
-            {
-                "nct_id": nct_id,
-                "title": title,
-                "conditions": conditions,
-                # Serialize dicts to JSON strings so psycopg adapts them to JSONB
-                "eligibility": json.dumps(elig or {}),
-                "locations": json.dumps(payload.get("protocolSection", {}).get("contactsLocationsModule", {}) or {}),
-                "payload": json.dumps(payload or {}),
-                "embedding": list(emb)
-            })
-        session.commit()
\ No newline at end of file
+        write(session, rows, _embed_planned(need, to_embed))
+        stats["written"] += len(rows)
+        stats["embedded"] += len(to_embed)
+    return stats
+
+def _batch_pages(pages, batch_size):
+    """Re-chunk (studies, ack, removed_ids) pages into (texts, rows, acks, removed_ids) batches of `batch_size`
+    rows. A page's ack and removals travel with the batch holding its last row, so they are committed together
+    and the ack only fires after that batch is written."""
+    texts, rows, acks, removed = [], [], [], []
+    for studies, ack, gone in pages:
+        t, r = _prepare_rows(studies)
+        while r:
+            room = batch_size - len(rows)
+            texts, rows = texts + t[:room], rows + r[:room]
+            t, r = t[room:], r[room:]
+            if len(rows) >= batch_size:
+                if not r:
+                    removed.extend(gone)
+                    gone = ()
+                    if ack:
+                        acks.append(ack)
+                        ack = None
+                yield texts, rows, acks, removed
+                texts, rows, acks, removed = [], [], [], []
+        removed.extend(gone)
+        if ack: acks.append(ack)
+    if rows or acks or removed:
+        yield texts, rows, acks, removed
+
+def _run_stage(fn, items, out, stop):
+    try:
+        for item in items:
+            if stop.is_set():
+                return
+            _put(out, fn(item), stop)
+        _put(out, None, stop)
+    except BaseException as e:
+        _put(out, e, stop)
+
+def _drain(q, stop):
+    while True:
+        try:
+            item = q.get(timeout=0.5)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is None:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+def ingest_pages(session, pages, batch_size=None, queue_size=None, bulk=False, force=False):
+    """
+    Streaming fetch -> embed -> upsert. `pages` yields (studies, ack) pairs (see iter_trial_pages(ack_pages=True))
+    or (studies, ack, removed_ids) triples, whose ids are deleted in the same transaction as the batch carrying
+    that page's ack; plain study lists are accepted too. Batching+parsing and embedding each run on their own
+    thread, joined by bounded queues, while this thread writes and commits, so peak memory is a few batches
+    regardless of how many pages are ingested. `bulk=True` writes each batch with COPY instead of row-by-row INSERTs.
+    Unchanged studies are skipped as in upsert_trials. Returns counts of written/embedded/unchanged/removed rows.
+    """
+    write = _write_rows_copy if bulk else _write_rows
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    qsize = max(1, queue_size or INGEST_QUEUE_SIZE)
+    pages = ((p, None, ()) if isinstance(p, list) else (*p, ()) if len(p) == 2 else p for p in pages)
+    batched, embedded = queue.Queue(maxsize=qsize), queue.Queue(maxsize=qsize)
+    stop = threading.Event()
+
+    # hash lookups run on the embed thread, so give it its own connection rather than sharing the session
+    lookup = session.get_bind().connect()
+
+    def embed(batch):
+        texts, rows, acks, removed = batch
+        rows, need, to_embed, skipped = _plan_rows(lookup, texts, rows, force)
+        lookup.rollback()
+        return rows, _embed_planned(need, to_embed), acks, removed, skipped, len(to_embed)
+
+    threads = [
+        threading.Thread(target=_run_stage, args=(lambda b: b, _batch_pages(pages, batch_size), batched, stop), daemon=True),
+        threading.Thread(target=_run_stage, args=(embed, _drain(batched, stop), embedded, stop), daemon=True),
+    ]
+    for th in threads:
+        th.start()
+    stats = _new_stats()
+    try:
+        for rows, vecs, acks, removed, skipped, n_embedded in _drain(embedded, stop):
+            if removed:
+                res = session.execute(text("DELETE FROM trials WHERE nct_id = ANY(:ids)"), {"ids": sorted(set(removed))})
+                stats["removed"] += res.rowcount
+            if rows:
+                write(session, rows, vecs)  # commits the deletes too
+            elif removed:
+                session.commit()
+            stats["written"] += len(rows)
+            stats["embedded"] += n_embedded
+            stats["unchanged"] += skipped
+            for ack in acks:
+                ack()
+    finally:
+        stop.set()
+        threads[1].join()
+        lookup.close()
+    return stats
@@ -1,17 +1,256 @@
 
-from sentence_transformers import SentenceTransformer
+import hashlib, multiprocessing, os, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from ..config import EMBEDDING_MODEL
+from ..config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_QUANTIZE,
+    EMBEDDING_DIM,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_DISK_CACHE_MAX_ROWS,
+    EMBEDDING_WORKERS,
+    EMBEDDING_BATCH_SIZE,
+)
 
 _model = None
+_model_lock = threading.Lock()
+_pool = None
+_pool_workers = 0
+
+_lock = threading.Lock()  # LRU and stats only; never held across SQLite I/O
+_lru = OrderedDict()
+# on-disk store: one SQLite connection per thread; _disk_lock guards the schema setup and the counters below
+_local = threading.local()
+_disk_lock = threading.Lock()
+_disk_ready = False
+_disk_writes = 0  # rows written since the last size check
+_touched = {}  # key -> last disk hit, not yet written to used_at
+_DISK_TRIM_EVERY = 1000
+_TOUCH_FLUSH = 256
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "encoded": 0, "encode_s": 0.0}
+
+def load_model(backend=None, threads=None):
+    """
+    A fresh encoder for `backend` ("torch" or "onnx"); both expose encode(texts, normalize_embeddings=True).
+    `threads` caps intra-op CPU threads (used by pool workers so they don't oversubscribe cores).
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "onnx":
+        from .onnx_backend import OnnxEncoder
+        return OnnxEncoder(threads=threads)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
 
 def get_model():
     global _model
     if _model is None:
-        _model = SentenceTransformer(EMBEDDING_MODEL)
+        with _model_lock:  # startup preload and an early request must not both load it
+            if _model is None:
+                _model = load_model()
     return _model
 
-def embed_texts(texts):
+def model_loaded():
+    return _model is not None
+
+def warm_up():
+    """Load the model and run one throwaway encode (first-inference allocations/JIT); returns seconds per phase."""
+    t0 = time.perf_counter()
     model = get_model()
-    v = model.encode(texts, normalize_embeddings=True)
-    return np.asarray(v, dtype=np.float32)
+    t1 = time.perf_counter()
+    model.encode(["Diagnosis: lymphoma; Age 60; ECOG 1"], normalize_embeddings=True)
+    t2 = time.perf_counter()
+    return {"model_load_s": round(t1 - t0, 3), "warmup_encode_s": round(t2 - t1, 3)}
+
+def _key(text):
+    # the backend is part of the key: int8 ONNX vectors drift slightly from the torch ones
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\n{backend_tag()}\n{text}".encode("utf-8")).hexdigest()
+
+def backend_tag():
+    """Which encoder produced a vector ("torch", "onnx", "onnx-int8"); part of every embedding cache/hash key."""
+    if EMBEDDING_BACKEND == "onnx":
+        return "onnx-int8" if EMBEDDING_ONNX_QUANTIZE else "onnx"
+    return "torch"
+
+def _worker_init(threads):
+    # each worker loads the model once and keeps it for every batch it is sent
+    global _model
+    _model = load_model(threads=threads)
+
+def _encode_batch(texts):
+    return np.asarray(_model.encode(texts, normalize_embeddings=True, batch_size=len(texts)), dtype=np.float32)
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_worker_init, initargs=(threads,))
+        _pool_workers = workers
+    return _pool
+
+def encode_uncached(texts, workers=None, batch_size=None):
+    """
+    Encode without the cache. Texts are sorted by length and cut into `batch_size` chunks so each batch pads
+    to similar lengths; with workers > 1 the chunks are spread over a process pool, each worker holding one model.
+    """
+    workers = EMBEDDING_WORKERS if workers is None else workers
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    if workers <= 1:
+        return np.asarray(get_model().encode(list(texts), normalize_embeddings=True, batch_size=batch_size),
+                          dtype=np.float32)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    chunks = [order[i:i+batch_size] for i in range(0, len(order), batch_size)]
+    out = np.empty((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for idx, vecs in zip(chunks, _get_pool(workers).map(_encode_batch, [[texts[j] for j in c] for c in chunks])):
+        out[idx] = vecs
+    return out
+
+def _get_disk():
+    """This thread's connection to the on-disk store, or None when it is disabled."""
+    global _disk_ready
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    con = getattr(_local, "con", None)
+    if con is None:
+        os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH) or ".", exist_ok=True)
+        con = sqlite3.connect(EMBEDDING_CACHE_PATH, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")  # a cache: losing the last commits on power loss is fine
+        with _disk_lock:
+            if not _disk_ready:
+                con.execute("CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vec BLOB, used_at REAL)")
+                try:
+                    con.execute("ALTER TABLE embedding_cache ADD COLUMN used_at REAL")  # stores from before eviction
+                except sqlite3.OperationalError:
+                    pass
+                con.execute("CREATE INDEX IF NOT EXISTS embedding_cache_used_at ON embedding_cache (used_at)")
+                con.commit()
+                _disk_ready = True
+        _local.con = con
+    return con
+
+def _take_touched(force=False):
+    """Pending used_at refreshes to write, once enough hits have piled up (or with `force`)."""
+    global _touched
+    with _disk_lock:
+        if not _touched or (not force and len(_touched) < _TOUCH_FLUSH):
+            return []
+        out, _touched = _touched, {}
+    return [(t, k) for k, t in out.items()]
+
+def _disk_get(keys):
+    con = _get_disk()
+    if con is None or not keys:
+        return {}
+    out = {}
+    for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+        chunk = keys[i:i+500]
+        rows = con.execute(
+            f"SELECT key, vec FROM embedding_cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        out.update({k: np.frombuffer(v, dtype=np.float32) for k, v in rows})
+    if out:
+        # hits only refresh used_at in batches of _TOUCH_FLUSH, so a lookup is normally read-only
+        now = time.time()
+        with _disk_lock:
+            _touched.update((k, now) for k in out)
+        touched = _take_touched()
+        if touched:
+            con.executemany("UPDATE embedding_cache SET used_at = ? WHERE key = ?", touched)
+            con.commit()
+    return out
+
+def _disk_put(items):
+    global _disk_writes
+    con = _get_disk()
+    if con is None or not items:
+        return
+    now = time.time()
+    con.executemany("INSERT OR REPLACE INTO embedding_cache (key, vec, used_at) VALUES (?, ?, ?)",
+                    [(k, v.astype(np.float32).tobytes(), now) for k, v in items.items()])
+    con.executemany("UPDATE embedding_cache SET used_at = ? WHERE key = ?", _take_touched(force=True))
+    # counting rows scans the table, so check the size only every _DISK_TRIM_EVERY writes
+    with _disk_lock:
+        _disk_writes += len(items)
+        trim = _disk_writes >= _DISK_TRIM_EVERY
+        if trim:
+            _disk_writes = 0
+    if trim:
+        excess = con.execute("SELECT count(*) FROM embedding_cache").fetchone()[0] - EMBEDDING_DISK_CACHE_MAX_ROWS
+        if excess > 0:
+            con.execute("DELETE FROM embedding_cache WHERE key IN "
+                        "(SELECT key FROM embedding_cache ORDER BY used_at LIMIT ?)", (excess,))
+    con.commit()
+
+def _lru_put(k, v):
+    _lru[k] = v
+    _lru.move_to_end(k)
+    while len(_lru) > EMBEDDING_CACHE_SIZE:
+        _lru.popitem(last=False)
+
+def embed_texts(texts, workers=1, persist=True):
+    """
+    Normalized float32 embeddings, one row per text. Looks texts up in the in-process LRU, then the on-disk
+    store (both keyed by sha256 of EMBEDDING_MODEL + text); only the remaining misses go to the model, in one batch.
+    Request paths encode in-process; bulk ingest passes `workers` to spread misses over the process pool, and
+    `persist=False` since trial vectors live in Postgres and would only crowd patient vectors out of the disk store.
+    """
+    keys = [_key(t) for t in texts]
+    found = {}
+    with _lock:
+        for k in keys:
+            if k in _lru:
+                _lru.move_to_end(k)
+                found[k] = _lru[k]
+        _stats["memory_hits"] += len(found)
+    todo = [k for k in dict.fromkeys(keys) if k not in found]
+    disk = _disk_get(todo)
+    if disk:
+        with _lock:
+            for k, v in disk.items():
+                _lru_put(k, v)
+            _stats["disk_hits"] += len(disk)
+        found.update(disk)
+
+    missing = {k: t for k, t in zip(keys, texts) if k not in found}
+    if missing:
+        t0 = time.perf_counter()
+        v = encode_uncached(list(missing.values()), workers=workers)
+        encode_s = time.perf_counter() - t0
+        fresh = dict(zip(missing.keys(), np.asarray(v, dtype=np.float32)))
+        if persist:
+            _disk_put(fresh)
+        with _lock:
+            for k, vec in fresh.items():
+                _lru_put(k, vec)
+            _stats["misses"] += len(fresh)
+            _stats["encoded"] += len(fresh)
+            _stats["encode_s"] += encode_s
+        found.update(fresh)
+
+    if not keys:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+def cache_stats():
+    with _lock:
+        out = dict(_stats)
+        out["memory_entries"] = len(_lru)
+    hits = out["memory_hits"] + out["disk_hits"]
+    lookups = hits + out["misses"]
+    per_text = out["encode_s"] / out["encoded"] if out["encoded"] else None
+    out["hit_rate"] = round(hits / lookups, 3) if lookups else None
+    out["saved_encode_s_est"] = round(hits * per_text, 3) if per_text else None
+    out["encode_s"] = round(out["encode_s"], 3)
+    out["disk_path"] = EMBEDDING_CACHE_PATH or None
+    return out
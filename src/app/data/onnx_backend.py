@@ -0,0 +1,90 @@
+
+import os
+import numpy as np
+from ..config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_QUANTIZE, EMBEDDING_MAX_SEQ_LENGTH
+
+_INPUTS = ["input_ids", "attention_mask", "token_type_ids"]
+
+def _model_dir(model_name, base_dir):
+    return os.path.join(base_dir, model_name.replace("/", "__"))
+
+def export_onnx(model_name=EMBEDDING_MODEL, base_dir=EMBEDDING_ONNX_DIR, quantize=True):
+    """
+    Export the transformer behind `model_name` to ONNX (+ an int8 dynamically quantized copy) with its tokenizer.
+    Needs torch/transformers (already installed with sentence-transformers); serving only needs onnxruntime.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out = _model_dir(model_name, base_dir)
+    os.makedirs(out, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(model_name)
+    tok.save_pretrained(out)
+    model = AutoModel.from_pretrained(model_name).eval()
+    dummy = tok(["a short warm-up sentence"], return_tensors="pt")
+    names = [n for n in _INPUTS if n in dummy]
+    fp32 = os.path.join(out, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(dummy[n] for n in names),
+            fp32,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "batch", 1: "seq"} for n in names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32, os.path.join(out, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    return out
+
+class OnnxEncoder:
+    """
+    Drop-in for SentenceTransformer.encode on mean-pooling models such as all-MiniLM-L6-v2:
+    same tokenizer, truncation and pooling, so vectors fit the existing vector(384) column.
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL, base_dir=EMBEDDING_ONNX_DIR, quantized=EMBEDDING_ONNX_QUANTIZE,
+                 max_seq_length=EMBEDDING_MAX_SEQ_LENGTH, threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        d = _model_dir(model_name, base_dir)
+        path = os.path.join(d, "model.int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(path):
+            export_onnx(model_name, base_dir, quantize=quantized)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = Tokenizer.from_file(os.path.join(d, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32, **_):
+        if isinstance(texts, str):
+            texts = [texts]
+        # like sentence-transformers: batch by length so padding stays short, then restore input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = []
+        for i in range(0, len(order), batch_size):
+            enc = self.tokenizer.encode_batch([texts[j] for j in order[i:i+batch_size]])
+            feeds = {
+                "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {n: feeds[n] for n in self.input_names})[0]
+            mask = feeds["attention_mask"][..., None].astype(np.float32)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                emb = emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out.append(emb.astype(np.float32))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        stacked = np.concatenate(out)
+        emb = np.empty_like(stacked)
+        emb[order] = stacked
+        return emb
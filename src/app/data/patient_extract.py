@@ -1,6 +1,16 @@
 
 import re, datetime
-from dateparser import parse as dateparse
+
+# known biomarker tokens, matched as lowercase substrings in patient data and trial criteria
+BIOMARKER_TOKENS = ["pik3ca", "brca", "egfr", "alk", "braf", "flt3", "esr1", "msi-h", "her2", "pd-l1"]
+
+def dateparse(s: str):
+    # FHIR birthDate is ISO; only fall back to dateparser (slow to import) for anything else
+    try:
+        return datetime.date.fromisoformat(s.strip())
+    except (ValueError, AttributeError):
+        from dateparser import parse
+        return parse(s)
 
 def calc_age(birthDate: str) -> int | None:
     dt = dateparse(birthDate)
@@ -31,7 +41,7 @@ def extract_structured(bundle: dict) -> dict:
             try: ecog = int(str(val).strip())
             except: pass
         valstr = (o.get("valueString") or "").lower()
-        for token in ["pik3ca","brca","egfr","alk","braf","flt3","esr1","msi-h","her2","pd-l1"]:
+        for token in BIOMARKER_TOKENS:
             if token in valstr:
                 biomarkers.add(token.upper())
 
@@ -55,7 +65,7 @@ def extract_from_notes(notes: str) -> dict:
     m = re.search(r"ecog\s*([0-4])", txt)
     if m: out["ecog"] = int(m.group(1))
     biomarkers = set()
-    for token in ["pik3ca","brca","egfr","alk","braf","flt3","esr1","msi-h","her2","pd-l1"]:
+    for token in BIOMARKER_TOKENS:
         if token in txt: biomarkers.add(token.upper())
     if biomarkers: out["biomarkers"] = sorted(biomarkers)
     if "autoimmune" in txt: out["autoimmune_history"] = True
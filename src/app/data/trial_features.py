@@ -0,0 +1,34 @@
+from .patient_extract import BIOMARKER_TOKENS
+
+# Bump when extract_trial_features changes; rows with another version are ignored (scored from raw text)
+FEATURES_VERSION = "2"
+
+# words the scorer treats as "the criteria talk about sex" (substring matches, so "women" also hits "men")
+SEX_WORDS = ["female", "women", "male", "men"]
+
+def exclusion_offset(norm_text: str):
+    """Where the exclusion section of lowercased CT.gov criteria starts, or None without an exclusion header."""
+    cut = norm_text.find("exclusion criteria")
+    return cut if cut >= 0 else None
+
+def split_criteria(norm_text: str, exclusion_at=None):
+    """(inclusion, exclusion) sections of lowercased criteria, cut at `exclusion_at` (see exclusion_offset)."""
+    cut = exclusion_offset(norm_text) if exclusion_at is None else exclusion_at
+    inclusion, exclusion = (norm_text, "") if cut is None else (norm_text[:cut], norm_text[cut:])
+    start = inclusion.find("inclusion criteria")
+    return (inclusion[start:] if start >= 0 else inclusion).strip(), exclusion.strip()
+
+def extract_trial_features(criteria: str | None) -> dict:
+    """
+    Per-trial record precomputed at ingest. `norm_text` is exactly criteria.lower(), and the flags are the
+    substring tests _compute_score runs on it, so scoring from this record gives identical results.
+    """
+    norm = (criteria or "").lower()
+    return {
+        "norm_text": norm,
+        "mentions_ecog": "ecog" in norm,
+        "biomarkers": [b for b in BIOMARKER_TOKENS if b in norm],
+        "mentions_sex_words": any(w in norm for w in SEX_WORDS),
+        # an offset rather than the two sections, so the criteria text is stored once
+        "exclusion_at": exclusion_offset(norm),
+    }
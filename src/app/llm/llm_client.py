@@ -1,16 +1,115 @@
 
-import requests
-from ..config import LLM_BASE_URL, LLM_MODEL
+import asyncio, json, time
+from concurrent.futures import ThreadPoolExecutor, wait
+from ..config import LLM_BASE_URL, LLM_MODEL, LLM_CONCURRENCY, LLM_DEADLINE_S
 
-def generate(messages, temperature=0.2, max_tokens=512):
-    url = f"{LLM_BASE_URL}/api/chat"
-    payload = {
+_pool = None
+_aclient = None
+_asem = None
+
+def _get_pool():
+    # one shared pool so the cap applies to all in-flight requests, not per request
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(1, LLM_CONCURRENCY), thread_name_prefix="llm")
+    return _pool
+
+def _chat_payload(messages, temperature, max_tokens, stream=False):
+    return {
         "model": LLM_MODEL,
         "messages": messages,
-        "stream": False,
+        "stream": stream,
         "options": {"temperature": temperature, "num_predict": max_tokens}
     }
-    r = requests.post(url, json=payload, timeout=120)
+
+def generate(messages, temperature=0.2, max_tokens=512, timeout=120):
+    import requests
+    url = f"{LLM_BASE_URL}/api/chat"
+    payload = _chat_payload(messages, temperature, max_tokens)
+    r = requests.post(url, json=payload, timeout=timeout)
     r.raise_for_status()
     data = r.json()
     return data.get("message", {}).get("content", "")
+
+def generate_many(message_lists, deadline_s=None, **kwargs):
+    """
+    Fan out several chats over the shared pool and wait at most `deadline_s` seconds overall.
+    Returns one entry per input: the completion, or None if it failed or missed the deadline.
+    Each call's HTTP timeout is the time left until the deadline, so a pool thread is never held past it.
+    """
+    deadline_s = LLM_DEADLINE_S if deadline_s is None else deadline_s
+    end = time.monotonic() + deadline_s
+
+    def call(m):
+        left = end - time.monotonic()
+        if left <= 0:
+            return None  # started after the deadline; its result would be discarded anyway
+        return generate(m, timeout=left, **kwargs)
+
+    pool = _get_pool()
+    futures = [pool.submit(call, m) for m in message_lists]
+    _, pending = wait(futures, timeout=deadline_s)
+    for f in pending:
+        f.cancel()  # drop calls that never started; running ones time out at the deadline
+
+    out = []
+    for f in futures:
+        if f.done() and not f.cancelled() and f.exception() is None:
+            out.append(f.result())
+        else:
+            out.append(None)
+    return out
+
+def _get_async():
+    # created lazily inside the running loop; the semaphore is the async counterpart of the shared thread pool
+    global _aclient, _asem
+    if _aclient is None:
+        import httpx
+        _aclient = httpx.AsyncClient(base_url=LLM_BASE_URL, timeout=120)
+        _asem = asyncio.Semaphore(max(1, LLM_CONCURRENCY))
+    return _aclient, _asem
+
+async def agenerate(messages, temperature=0.2, max_tokens=512):
+    client, sem = _get_async()
+    async with sem:
+        r = await client.post("/api/chat", json=_chat_payload(messages, temperature, max_tokens))
+    r.raise_for_status()
+    data = r.json()
+    return data.get("message", {}).get("content", "")
+
+async def agenerate_stream(messages, temperature=0.2, max_tokens=512):
+    """Yield content deltas from Ollama's stream mode as they are generated."""
+    client, sem = _get_async()
+    payload = _chat_payload(messages, temperature, max_tokens, stream=True)
+    async with sem:
+        async with client.stream("POST", "/api/chat", json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                delta = data.get("message", {}).get("content", "")
+                if delta:
+                    yield delta
+                if data.get("done"):
+                    break
+
+async def agenerate_many(message_lists, deadline_s=None, **kwargs):
+    """
+    Async generate_many: all chats run as tasks (at most LLM_CONCURRENCY in flight) and anything still
+    running at the deadline is cancelled, which also closes its HTTP request.
+    """
+    deadline_s = LLM_DEADLINE_S if deadline_s is None else deadline_s
+    tasks = [asyncio.create_task(agenerate(m, **kwargs)) for m in message_lists]
+    if not tasks:
+        return []
+    _, pending = await asyncio.wait(tasks, timeout=deadline_s)
+    for t in pending:
+        t.cancel()
+    return [t.result() if t.done() and not t.cancelled() and t.exception() is None else None for t in tasks]
+
+async def aclose():
+    global _aclient
+    if _aclient is not None:
+        await _aclient.aclose()
+        _aclient = None
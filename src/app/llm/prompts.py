@@ -1,4 +1,7 @@
 
+# Bump whenever SYSTEM_MATCH or build_match_prompt changes so cached rationales are not reused
+PROMPT_VERSION = "1"
+
 SYSTEM_MATCH = """
 You are a clinical trial matching copilot for coordinators.
 Return compact JSON with keys:
@@ -1,16 +1,38 @@
+import io, itertools, json, logging, threading, time
+from typing import Literal
+
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from sqlalchemy import text
 
-from .services.db import db_init, get_session
-from .services.trials import refresh_trials_if_needed
-from .services.matching import match_for_patient_bundle
+from .config import PRELOAD_MODEL
+from .services.db import db_init, get_session, get_async_session, dispose_async_engine
+from .services.trials import corpus, init_corpus_state
+from .services.scheduler import TrialRefresher
+from .services.matching import match_for_patient_bundle, amatch_for_patient_bundle, astream_match_for_patient_bundle
+from .services.batch import iter_batch_items, batch_records
+from .services import rationale_cache
+from .data import embeddings
+from .llm import llm_client
 from .data.patient_extract import summarize_profile, build_patient_profile
 from .data.redact import scrub
 
 app = FastAPI(title="Bond Health Trial Matcher (beta-ut)")
 templates = Jinja2Templates(directory="src/app/templates")
+# uvicorn configures this logger, so startup timings show up next to its own messages
+log = logging.getLogger("uvicorn.error")
+startup = {"phases": {}, "model_error": None}
+
+
+def _on_sync(stats):
+    # a sync that loaded rows also recovers a corpus whose startup bootstrap failed
+    if not corpus.is_ready() and stats["written"]:
+        corpus.set("ready")
+
+
+refresher = TrialRefresher(on_success=_on_sync)
 
 
 class MatchRequest(BaseModel):
@@ -19,11 +41,85 @@ class MatchRequest(BaseModel):
     top_k: int = 10
     cond_hint: str | None = None
     country: str | None = "United States"
+    explain: bool = True
+    stream: Literal["ndjson", "sse"] | None = None
+    stream_tokens: bool = False
+
+
+def _timed(phase, fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    startup["phases"][phase] = round(time.perf_counter() - t0, 3)
+    log.info("startup: %s took %.3fs", phase, startup["phases"][phase])
+    return out
+
+
+def _preload_model():
+    try:
+        phases = embeddings.warm_up()
+        startup["phases"].update(phases)
+        log.info("startup: model load took %.3fs, warm-up encode %.3fs", phases["model_load_s"], phases["warmup_encode_s"])
+    except Exception as e:
+        startup["model_error"] = str(e)
+        log.exception("startup: model preload failed")
 
 
 @app.on_event("startup")
 def on_startup():
-    db_init()
+    _timed("db_init_s", db_init)
+    _timed("corpus_state_s", init_corpus_state, get_session)
+    refresher.start()
+    if PRELOAD_MODEL:
+        # off the startup path so liveness answers immediately; readiness waits for it
+        threading.Thread(target=_preload_model, name="model-preload", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    refresher.stop()
+    await dispose_async_engine()
+    await llm_client.aclose()
+
+
+def _corpus_unavailable():
+    state = corpus.snapshot()
+    if state["status"] == "error":
+        detail = f"Trial corpus failed to load: {state['error']}"
+    else:
+        detail = "Trial corpus is still loading, retry shortly"
+    return detail, {"Retry-After": "30"}
+
+
+@app.get("/healthz")
+def liveness():
+    """The process is up and serving; says nothing about dependencies."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readiness():
+    """Ready when the DB answers, the embedding model is loaded and the trial corpus is available."""
+    checks = {"model": embeddings.model_loaded() or not PRELOAD_MODEL, "corpus": corpus.is_ready()}
+    try:
+        with get_session() as s:
+            s.execute(text("SELECT 1"))
+        checks["db"] = True
+    except Exception:
+        checks["db"] = False
+    ready = all(checks.values())
+    body = {"ready": ready, "checks": checks, "startup": startup, "corpus": corpus.snapshot()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@app.get("/status/corpus")
+def corpus_status():
+    return corpus.snapshot()
+
+
+@app.get("/status/refresh")
+def refresh_status():
+    """Background CT.gov sync: last run time, duration, rows changed and error state."""
+    return refresher.status()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -35,6 +131,12 @@ def home():
     </body></html>"""
 
 
+@app.get("/stats/cache")
+def cache_stats():
+    """Hit/miss counters for the LLM rationale and embedding caches since process start."""
+    return {"rationale": rationale_cache.stats(), "embedding": embeddings.cache_stats()}
+
+
 @app.get("/report/{patient_id}", response_class=HTMLResponse)
 def report_example(request: Request, patient_id: str):
     """
@@ -50,11 +152,14 @@ def report_example(request: Request, patient_id: str):
     if not pfile.exists():
         return HTMLResponse(f"<h3>Patient {patient_id} not found</h3>", status_code=404)
 
+    if not corpus.is_ready():
+        detail, headers = _corpus_unavailable()
+        return HTMLResponse(f"<h3>{detail}</h3>", status_code=503, headers=headers)
+
     patient_fhir = json.loads(pfile.read_text())
     notes = nfile.read_text() if nfile.exists() else ""
 
     with get_session() as s:
-        refresh_trials_if_needed(s)
         matches = match_for_patient_bundle(s, patient_fhir, notes, top_k=10)
 
     profile = build_patient_profile(patient_fhir, notes)
@@ -72,24 +177,102 @@ def report_example(request: Request, patient_id: str):
     )
 
 
+def _stream_match(req: MatchRequest):
+    async def events():
+        async with get_async_session() as s:
+            try:
+                async for ev in astream_match_for_patient_bundle(
+                    s,
+                    req.patient_fhir,
+                    req.notes or "",
+                    top_k=req.top_k,
+                    cond_hint=req.cond_hint,
+                    country=req.country,
+                    explain=req.explain,
+                    tokens=req.stream_tokens,
+                ):
+                    yield ev
+            except Exception as e:
+                # headers are already sent, so failures become a final event instead of a 500
+                yield {"event": "error", "detail": str(e)}
+
+    async def ndjson():
+        async for ev in events():
+            yield json.dumps(ev) + "\n"
+
+    async def sse():
+        async for ev in events():
+            yield f"event: {ev['event']}\ndata: {json.dumps(ev)}\n\n"
+
+    if req.stream == "sse":
+        return StreamingResponse(sse(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
 @app.post("/match/patient")
-def match_patient(req: MatchRequest):
+async def match_patient(req: MatchRequest):
     """
     JSON API for programmatic use.
-    Body: { "patient_fhir": {...}, "notes": "...", "top_k": 10, "cond_hint": null, "country": "United States" }
+    Body: { "patient_fhir": {...}, "notes": "...", "top_k": 10, "cond_hint": null, "country": "United States",
+            "explain": true, "stream": null }  (explain=false skips the LLM rationales)
+    "stream": "ndjson" or "sse" sends the scored matches at once, then each rationale as it completes
+    (plus raw tokens with "stream_tokens": true); see astream_match_for_patient_bundle for the events.
     """
+    if not corpus.is_ready():
+        detail, headers = _corpus_unavailable()
+        raise HTTPException(status_code=503, detail=detail, headers=headers)
+    if req.stream:
+        return _stream_match(req)
     try:
-        with get_session() as s:
-            refresh_trials_if_needed(s)
-            results = match_for_patient_bundle(
+        async with get_async_session() as s:
+            results = await amatch_for_patient_bundle(
                 s,
                 req.patient_fhir,
                 req.notes or "",
                 top_k=req.top_k,
                 cond_hint=req.cond_hint,
                 country=req.country,
+                explain=req.explain,
             )
         return {"matches": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+@app.post("/match/batch")
+async def match_batch(
+    request: Request,
+    top_k: int = 10,
+    cond_hint: str | None = None,
+    country: str | None = "United States",
+    explain: bool = False,
+):
+    """
+    Match many patients in one call. Body: a JSON array or NDJSON, one FHIR bundle or /match/patient-style
+    {"patient_fhir", "notes", "patient_id"} object per patient. Streams NDJSON, one line per patient
+    ({"index", "patient_id", "matches"} or {"index", "patient_id", "error"}) as each completes.
+    NDJSON lines are decoded and parsed only as the stream reaches them; a bad line becomes an error
+    record for its index. A malformed array, or a bad first item, is a 400.
+    """
+    if not corpus.is_ready():
+        detail, headers = _corpus_unavailable()
+        raise HTTPException(status_code=503, detail=detail, headers=headers)
+    # invalid UTF-8 turns into U+FFFD, which then fails that line's JSON parse rather than the whole stream
+    lines = io.TextIOWrapper(io.BytesIO(await request.body()), encoding="utf-8", errors="replace")
+    try:
+        items = iter_batch_items(lines, lenient=True)
+        first = next(items, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+    if isinstance(first, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {first}")
+    items = itertools.chain([first], items) if first is not None else iter(())
+
+    def stream():
+        # sync generator: Starlette iterates it in the threadpool, so the embed/SQL/LLM work stays off the loop
+        with get_session() as s:
+            for rec in batch_records(s, items, top_k=top_k, cond_hint=cond_hint, country=country, explain=explain):
+                yield json.dumps(rec) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,70 @@
+
+import json
+from .matching import iter_batch_matches
+
+def iter_batch_items(lines, lenient=False):
+    """
+    Parse a batch upload: either one JSON array or NDJSON (one object per line), read lazily for NDJSON.
+    Each object is a FHIR bundle or a /match/patient-style {"patient_fhir", "notes", "patient_id"} body.
+    A bad item raises ValueError, or with `lenient=True` is yielded as a ValueError in its place so that
+    batch_records reports it for that index and carries on (a malformed JSON array still raises).
+    """
+    lines = iter(lines)
+    for first in lines:
+        if first.strip():
+            break
+    else:
+        return
+    if first.lstrip().startswith("["):
+        rows = json.loads(first + "".join(lines))
+    else:
+        rows = (_loads(l) for l in _chain(first, lines) if l.strip())
+    for n, row in enumerate(rows):
+        if isinstance(row, ValueError):
+            row = ValueError(f"item {n}: invalid JSON: {row}")
+        elif not isinstance(row, dict):
+            row = ValueError(f"item {n}: expected a JSON object")
+        if isinstance(row, ValueError) and not lenient:
+            raise row
+        yield row
+
+def _loads(line):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+def _patient_id(item, bundle, n):
+    if not isinstance(bundle, dict):
+        return item.get("patient_id") or str(n)  # iter_batch_matches reports the bad bundle for this index
+    pid = item.get("patient_id") or bundle.get("id")
+    if not pid:
+        ident = (bundle.get("patient") or {}).get("identifier") or [{}]
+        pid = ident[0].get("value")
+    return pid or str(n)
+
+def batch_records(session, items, **kwargs):
+    """Run iter_batch_matches over parsed items and yield one NDJSON-ready dict per patient."""
+    ids = []
+
+    def pairs():
+        for n, item in enumerate(items):
+            if isinstance(item, ValueError):  # unparseable line from iter_batch_items(lenient=True)
+                ids.append(str(n))
+                yield item, ""
+                continue
+            bundle = item["patient_fhir"] if "patient_fhir" in item else item
+            ids.append(_patient_id(item, bundle, n))
+            yield bundle, item.get("notes") or ""
+
+    for i, results, error in iter_batch_matches(session, pairs(), **kwargs):
+        rec = {"index": i, "patient_id": ids[i]}
+        if error:
+            rec["error"] = error
+        else:
+            rec["matches"] = results
+        yield rec
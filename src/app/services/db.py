@@ -1,14 +1,142 @@
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
-from ..config import DATABASE_URL
+from ..config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT_S,
+    DB_POOL_RECYCLE_S,
+    DB_POOL_PRE_PING,
+    DB_PREPARE_THRESHOLD,
+    VECTOR_INDEX,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    IVFFLAT_LISTS,
+    IVFFLAT_PROBES,
+    ANN_ITERATIVE_SCAN,
+)
 
 _engine = None
 _Session = None
+_async_engine = None
+_AsyncSession = None
+
+VECTOR_INDEX_NAMES = {"hnsw": "trials_embedding_hnsw_idx", "ivfflat": "trials_embedding_ivfflat_idx"}
+
+def _vector_index_ddl(method, m=None, ef_construction=None, lists=None, concurrently=False):
+    how = "CONCURRENTLY " if concurrently else ""
+    name = VECTOR_INDEX_NAMES[method]
+    if method == "hnsw":
+        opts = f"m = {int(m or HNSW_M)}, ef_construction = {int(ef_construction or HNSW_EF_CONSTRUCTION)}"
+    else:
+        opts = f"lists = {int(lists or IVFFLAT_LISTS)}"
+    return f"CREATE INDEX {how}IF NOT EXISTS {name} ON trials USING {method} (embedding vector_cosine_ops) WITH ({opts})"
+
+def ensure_vector_index(con):
+    """Create the configured cosine ANN index on trials.embedding if it is missing."""
+    if VECTOR_INDEX in VECTOR_INDEX_NAMES:
+        con.execute(text(_vector_index_ddl(VECTOR_INDEX)))
+
+def rebuild_vector_index(engine, method=None, m=None, ef_construction=None, lists=None, concurrently=False):
+    """
+    Drop every ANN index on trials.embedding and build `method` from scratch.
+    Run after bulk loads: IVFFlat centroids are fixed at build time and HNSW builds faster in one pass.
+    """
+    method = (method or VECTOR_INDEX).lower()
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as con:
+        how = "CONCURRENTLY " if concurrently else ""
+        for name in VECTOR_INDEX_NAMES.values():
+            con.execute(text(f"DROP INDEX {how}IF EXISTS {name}"))
+        if method in VECTOR_INDEX_NAMES:
+            con.execute(text(_vector_index_ddl(method, m, ef_construction, lists, concurrently)))
+        con.execute(text("ANALYZE trials"))
+
+def _session_settings():
+    """Per-connection ANN knobs as (required, optional) SET statements; optional ones need pgvector >= 0.8."""
+    required = [f"SET hnsw.ef_search = {int(HNSW_EF_SEARCH)}", f"SET ivfflat.probes = {int(IVFFLAT_PROBES)}"]
+    optional = []
+    if ANN_ITERATIVE_SCAN in ("strict_order", "relaxed_order"):
+        optional.append(f"SET hnsw.iterative_scan = {ANN_ITERATIVE_SCAN}")
+        optional.append("SET ivfflat.iterative_scan = relaxed_order")
+    return required, optional
+
+def _on_connect(dbapi_conn, _record):
+    from psycopg import Error, ProgrammingError
+    from pgvector.psycopg import register_vector
+
+    # numpy arrays <-> vector in binary format, so query vectors are never rendered to / parsed from text
+    try:
+        register_vector(dbapi_conn)
+    except ProgrammingError:
+        pass  # extension not created yet; db_init recycles the pool once it exists
+    # per-session ANN recall/speed knobs; committed so the pool's reset-on-return keeps them
+    required, optional = _session_settings()
+    with dbapi_conn.cursor() as cur:
+        for sql in required:
+            cur.execute(sql)
+    dbapi_conn.commit()
+    for sql in optional:
+        try:
+            dbapi_conn.execute(sql)
+            dbapi_conn.commit()
+        except Error:
+            dbapi_conn.rollback()  # older pgvector: prefilters then only see the first ef_search/probes candidates
+
+def _on_connect_async(dbapi_conn, _record):
+    from psycopg import Error, ProgrammingError
+    from pgvector.psycopg import register_vector_async
+
+    # same setup as _on_connect, run on the underlying psycopg AsyncConnection
+    async def setup(conn):
+        try:
+            await register_vector_async(conn)
+        except ProgrammingError:
+            await conn.rollback()
+        required, optional = _session_settings()
+        async with conn.cursor() as cur:
+            for sql in required:
+                await cur.execute(sql)
+        await conn.commit()
+        for sql in optional:
+            try:
+                await conn.execute(sql)
+                await conn.commit()
+            except Error:
+                await conn.rollback()
+
+    dbapi_conn.run_async(setup)
+
+def _engine_kwargs():
+    return dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_S,
+        pool_recycle=DB_POOL_RECYCLE_S,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        # the match query is byte-identical on every call, so psycopg prepares it once per connection
+        # and later requests skip parse/plan
+        connect_args={"prepare_threshold": DB_PREPARE_THRESHOLD},
+    )
+
+def make_engine():
+    engine = create_engine(DATABASE_URL, future=True, **_engine_kwargs())
+    event.listen(engine, "connect", _on_connect)
+    return engine
+
+def make_async_engine():
+    """Engine for the async request path; postgresql+psycopg picks psycopg's AsyncConnection here."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(DATABASE_URL, **_engine_kwargs())
+    event.listen(engine.sync_engine, "connect", _on_connect_async)
+    return engine
 
 def db_init():
     global _engine, _Session
-    _engine = create_engine(DATABASE_URL, future=True)
+    _engine = make_engine()
     with _engine.connect() as con:
         con.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         con.execute(text("""
@@ -22,6 +150,43 @@ def db_init():
             embedding vector(384)
         )
         """))
+        con.execute(text("ALTER TABLE trials ADD COLUMN IF NOT EXISTS text_hash text"))
+        con.execute(text("ALTER TABLE trials ADD COLUMN IF NOT EXISTS payload_hash text"))
+        # structured prefilter columns, filled at ingest from eligibilityModule / statusModule / locations
+        for col, typ in [("min_age_years", "real"), ("max_age_years", "real"), ("sex", "text"),
+                         ("healthy_volunteers", "boolean"), ("overall_status", "text"),
+                         ("countries", "text[]"), ("states", "text[]")]:
+            con.execute(text(f"ALTER TABLE trials ADD COLUMN IF NOT EXISTS {col} {typ}"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS trials_age_idx ON trials (min_age_years, max_age_years)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS trials_sex_idx ON trials (sex)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS trials_status_idx ON trials (overall_status)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS trials_countries_idx ON trials USING gin (countries)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS trials_states_idx ON trials USING gin (states)"))
+        # weighted full-text document for hybrid retrieval; generated, so ingest never writes it
+        con.execute(text("""
+        ALTER TABLE trials ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(conditions, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(eligibility->>'eligibilityCriteria', '')), 'C')
+        ) STORED
+        """))
+        con.execute(text("CREATE INDEX IF NOT EXISTS trials_search_tsv_idx ON trials USING gin (search_tsv)"))
+        # narrow per-trial scoring features derived from the criteria text at ingest (data.trial_features)
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS trial_features (
+            nct_id text primary key references trials (nct_id) on delete cascade,
+            version text,
+            norm_text text,
+            mentions_ecog boolean,
+            biomarkers text[],
+            mentions_sex_words boolean,
+            exclusion_at integer
+        )
+        """))
+        # tables from FEATURES_VERSION 1 stored the inclusion/exclusion sections (a second copy of the text)
+        con.execute(text("ALTER TABLE trial_features ADD COLUMN IF NOT EXISTS exclusion_at integer"))
+        for col in ("ecog_max", "sex_words", "inclusion_text", "exclusion_text"):
+            con.execute(text(f"ALTER TABLE trial_features DROP COLUMN IF EXISTS {col}"))
         con.execute(text("""
         CREATE TABLE IF NOT EXISTS patients (
             patient_id text primary key,
@@ -29,10 +194,52 @@ def db_init():
             embedding vector(384)
         )
         """))
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS rationale_cache (
+            key text primary key,
+            model text,
+            prompt_version text,
+            response text,
+            created_at timestamptz default now(),
+            last_used_at timestamptz default now()
+        )
+        """))
+        con.execute(text("CREATE INDEX IF NOT EXISTS rationale_cache_last_used_idx ON rationale_cache (last_used_at)"))
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name text primary key,
+            value text,
+            updated_at timestamptz default now()
+        )
+        """))
+        ensure_vector_index(con)
         con.commit()
+    # connections opened before CREATE EXTENSION could not register the vector adapter
+    _engine.dispose()
     _Session = sessionmaker(bind=_engine, future=True)
 
+def get_engine():
+    if _engine is None:
+        db_init()
+    return _engine
+
 def get_session():
     if _Session is None:
         db_init()
     return _Session()
+
+def get_async_session():
+    """AsyncSession on a lazily created async engine; call db_init() first so the schema exists."""
+    global _async_engine, _AsyncSession
+    if _AsyncSession is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_engine = make_async_engine()
+        _AsyncSession = async_sessionmaker(bind=_async_engine, expire_on_commit=False)
+    return _AsyncSession()
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSession
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine, _AsyncSession = None, None
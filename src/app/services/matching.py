@@ -1,17 +1,37 @@
+import asyncio
 from sqlalchemy import text
-from rapidfuzz import fuzz
 import numpy as np
 
+from ..config import (
+    HNSW_EF_SEARCH,
+    LLM_DEADLINE_S,
+    MATCH_BATCH_CHUNK,
+    MATCH_BATCH_MAX_ROWS,
+    MATCH_CANDIDATE_POOL,
+    RERANK_SCORE_WEIGHT,
+    RETRIEVAL_MODE,
+    RRF_K,
+    VECTOR_INDEX,
+)
 from ..data.embeddings import embed_texts
-from ..data.patient_extract import build_patient_profile, summarize_profile
-from ..llm.llm_client import generate
+from ..data.patient_extract import BIOMARKER_TOKENS, build_patient_profile, summarize_profile
+from ..data.trial_features import FEATURES_VERSION, extract_trial_features
+from ..llm.llm_client import generate_many, agenerate, agenerate_many, agenerate_stream
 from ..llm.prompts import SYSTEM_MATCH, build_match_prompt
+from . import rationale_cache
+
+
+def _fuzz():
+    # rapidfuzz is only needed once a match runs; keep it off the import path
+    from rapidfuzz import fuzz
+    return fuzz
 
 
 def _compute_score(profile: dict, eligibility_text: str):
     """
     Simple weighted scorer + list of ambiguous/missing items.
     """
+    fuzz = _fuzz()
     score = 0.0
     breakdown = {}
     uncertain = []
@@ -80,51 +100,296 @@ def _compute_score(profile: dict, eligibility_text: str):
     return round(score, 3), breakdown, sorted(set(uncertain))
 
 
-def match_for_patient_bundle(
-    session,
-    bundle: dict,
-    notes: str,
-    top_k: int = 10,
-    cond_hint: str | None = None,
-    country: str | None = "United States",
-):
+_BIOMARKER_SET = set(BIOMARKER_TOKENS)
+
+
+def _biomarker_hits(bms, feature):
+    # known tokens are looked up in the stored list; anything else falls back to a substring test
+    found = set(feature["biomarkers"] or ())
+    return sum(1 for b in bms if (b in found if b in _BIOMARKER_SET else b in feature["norm_text"]))
+
+
+def _compute_scores(profile: dict, eligibility_texts):
+    """Batch _compute_score: one result per text, identical to calling it per text."""
+    return _score_features(profile, [extract_trial_features(t) for t in eligibility_texts])
+
+
+def _score_features(profile: dict, features):
     """
-    Build a patient profile, embed it, vector-retrieve candidate trials, score, and (optionally) LLM-rationalize.
+    _compute_score over precomputed trial feature records (data.trial_features), so per-trial work is
+    lookups: the lowercased text comes from the record, and the ECOG / biomarker / sex-word substring tests
+    are stored flags. The fuzzy components run through rapidfuzz.process.cdist across all cores, and the
+    components are summed as float64 arrays in the same order as the scalar version, so every value rounds
+    the same way.
     """
-    profile = build_patient_profile(bundle, notes)
-    patient_summary = summarize_profile(profile)
+    from rapidfuzz import process
+
+    fuzz = _fuzz()
+    texts = [f["norm_text"] for f in features]
+    n = len(texts)
+    if not n:
+        return []
+    score = np.zeros(n, dtype=np.float64)
+    parts = {}
+    uncertain = []
+
+    diag = (profile.get("diagnosis_hint") or "").strip()
+    if diag:
+        dmatch = process.cdist([diag.lower()], texts, scorer=fuzz.partial_ratio, dtype=np.float64, workers=-1)[0]
+        parts["diagnosis"] = dmatch / 100 * 0.25
+    else:
+        uncertain.append("diagnosis")
+
+    ecog = profile.get("ecog")
+    if ecog is not None:
+        mentioned = np.array([bool(f["mentions_ecog"]) for f in features])
+        parts["ecog"] = np.where(mentioned, 0.15 if ecog in (0, 1) else 0.08 if ecog == 2 else 0.0, 0.05)
+    else:
+        uncertain.append("ECOG")
+
+    bms = [b.lower() for b in profile.get("biomarkers") or []]
+    if bms:
+        hits = np.array([_biomarker_hits(bms, f) for f in features], dtype=np.float64)
+        parts["biomarkers"] = np.minimum(0.2, 0.07 * hits)
+
+    if profile.get("age") is not None:
+        parts["age"] = np.full(n, 0.1 if profile["age"] >= 18 else 0.0)
+    else:
+        uncertain.append("age")
+
+    if profile.get("gender"):
+        mentioned = np.array([bool(f["mentions_sex_words"]) for f in features])
+        parts["gender"] = np.where(mentioned, 0.05, 0.03)
+
+    summary = summarize_profile(profile).lower()
+    fit = process.cdist([summary], texts, scorer=fuzz.token_set_ratio, dtype=np.float64, workers=-1)[0] / 100.0
+    parts["text_fit"] = 0.2 * fit
+
+    for s in parts.values():
+        score += s
+    score = np.minimum(1.0, score)
+    uncertain = sorted(set(uncertain))
+    # Python's round() on Python floats, not np.round, which rounds some halves differently
+    cols = {k: v.tolist() for k, v in parts.items()}
+    return [
+        (round(sc, 3), {k: round(v[i], 3) for k, v in cols.items()}, list(uncertain))
+        for i, sc in enumerate(score.tolist())
+    ]
+
 
-    # Embed summary -> vector literal for pgvector
-    vec = embed_texts([patient_summary])[0]  # np.array (384,)
-    vec_list = vec.tolist() if isinstance(vec, np.ndarray) else list(vec)
-    vec_lit = "[" + ",".join(str(float(x)) for x in vec_list) + "]"
+# Structured prefilter applied before the ANN ordering; a NULL parameter (unknown age/sex/country, no cond_hint)
+# and a NULL/empty column (bound not stated by the trial) both let a row through. With hnsw/ivfflat
+# iterative_scan on (services.db), the index keeps scanning until LIMIT rows pass; relaxed_order can return
+# them slightly out of order, which the outer ORDER BY dist fixes.
+_PREFILTER = """
+      ({age} IS NULL OR ((min_age_years IS NULL OR min_age_years <= {age})
+                          AND (max_age_years IS NULL OR max_age_years >= {age})))
+      AND ({sex} IS NULL OR sex IS NULL OR sex IN ('ALL', {sex}))
+      AND ({country} IS NULL OR countries IS NULL OR cardinality(countries) = 0 OR countries @> ARRAY[{country}])
+      AND (CAST(:cond AS text) IS NULL OR conditions ILIKE '%' || CAST(:cond AS text) || '%')"""
 
-    # Vector similarity using pgvector's <=> operator; cast parameter to vector
-    q = session.execute(
-        text(
-            """
-        SELECT nct_id, title, eligibility, 1 - (embedding <=> (:v)::vector) AS sim
+# Candidate columns after the nct_id/sim pair: the stored scoring features, or (no current trial_features row)
+# the raw criteria text to derive them from. Joined after the LIMIT, so the JSONB is only read for those rows.
+_FEATURE_COLS = """
+       CASE WHEN f.nct_id IS NULL THEN t.eligibility->>'eligibilityCriteria' END AS raw_text,
+       f.norm_text, f.mentions_ecog, f.mentions_sex_words, f.biomarkers"""
+_FEATURE_JOIN = "LEFT JOIN trial_features f ON f.nct_id = t.nct_id AND f.version = :fv"
+
+_KNN_SQL = text(
+    """
+SELECT nn.nct_id, 1 - nn.dist AS sim,"""
+    + _FEATURE_COLS
+    + """
+FROM (
+    SELECT nct_id, embedding <=> :v AS dist
+    FROM trials
+    WHERE"""
+    + _PREFILTER.format(age="CAST(:age AS real)", sex="CAST(:sex AS text)", country="CAST(:country AS text)")
+    + """
+    ORDER BY dist
+    LIMIT :k
+) nn
+JOIN trials t ON t.nct_id = nn.nct_id
+"""
+    + _FEATURE_JOIN
+    + """
+ORDER BY nn.dist
+"""
+)
+
+# Hybrid retrieval: the top :k trials by cosine distance (ANN index) and by ts_rank_cd over search_tsv
+# (GIN index), both prefiltered, fused by reciprocal rank: rrf = sum over lists of 1 / (:rrf_k + rank).
+# A trial found by only one list still competes; sim stays the cosine similarity for the response.
+_HYBRID_SQL = text(
+    """
+WITH q AS (SELECT websearch_to_tsquery('english', :tsq) AS tsq),
+vec AS (
+    SELECT nct_id, row_number() OVER (ORDER BY dist) AS r
+    FROM (
+        SELECT nct_id, embedding <=> :v AS dist
         FROM trials
-        ORDER BY embedding <=> (:v)::vector
+        WHERE"""
+    + _PREFILTER.format(age="CAST(:age AS real)", sex="CAST(:sex AS text)", country="CAST(:country AS text)")
+    + """
+        ORDER BY dist
         LIMIT :k
-        """
-        ),
-        {"v": vec_lit, "k": top_k},
-    )
-    rows = q.fetchall()
-
-    results = []
-    for nct_id, title, eligibility, sim in rows:
-        elig_text = ""
-        if isinstance(eligibility, dict):
-            elig_text = eligibility.get("eligibilityCriteria", "") or ""
-
-        score, breakdown, uncertain = _compute_score(profile, elig_text)
-
-        # Try to get an LLM rationale if local model is available
-        llm_expl = None
-        try:
-            messages = [
+    ) nn
+),
+lex AS (
+    SELECT nct_id, row_number() OVER (ORDER BY rank DESC) AS r
+    FROM (
+        SELECT nct_id, ts_rank_cd(search_tsv, q.tsq) AS rank
+        FROM trials, q
+        WHERE search_tsv @@ q.tsq AND"""
+    + _PREFILTER.format(age="CAST(:age AS real)", sex="CAST(:sex AS text)", country="CAST(:country AS text)")
+    + """
+        ORDER BY rank DESC
+        LIMIT :k
+    ) ft
+),
+fused AS (
+    SELECT nct_id, sum(1.0 / (:rrf_k + r)) AS rrf
+    FROM (SELECT nct_id, r FROM vec UNION ALL SELECT nct_id, r FROM lex) u
+    GROUP BY nct_id
+    ORDER BY rrf DESC
+    LIMIT :k
+)
+SELECT t.nct_id, 1 - (t.embedding <=> :v) AS sim,"""
+    + _FEATURE_COLS
+    + """
+FROM fused x
+JOIN trials t ON t.nct_id = x.nct_id
+"""
+    + _FEATURE_JOIN
+    + """
+ORDER BY x.rrf DESC, t.nct_id
+"""
+)
+
+
+def lexical_query(profile: dict) -> str:
+    """websearch_to_tsquery input OR-ing the patient's diagnosis, conditions, biomarkers and medications."""
+    terms = [profile.get("diagnosis_hint")] + list(profile.get("conditions") or [])
+    terms += list(profile.get("biomarkers") or []) + list(profile.get("meds") or [])
+    seen, out = set(), []
+    for t in terms:
+        t = (t or "").replace('"', " ").strip().lower()
+        if t and t not in seen:
+            seen.add(t)
+            out.append(f'"{t}"')  # quoted: multi-word names stay phrases and a leading "-" is not negation
+    return " or ".join(out)
+
+
+def _retrieval(vec, profile: dict, top_k: int, cond_hint, country, mode: str | None):
+    """(statement, params) for the configured retrieval mode: "vector" or "hybrid"."""
+    params = {"v": vec, "k": top_k, "fv": FEATURES_VERSION, **_prefilter_params(profile, country, cond_hint)}
+    if (mode or RETRIEVAL_MODE) == "hybrid":
+        params.update(tsq=lexical_query(profile), rrf_k=RRF_K)
+        return _HYBRID_SQL, params
+    return _KNN_SQL, params
+
+
+# Without iterative scans an HNSW probe returns at most ef_search rows, so a candidate pool larger than the
+# per-connection HNSW_EF_SEARCH widens it for the current transaction only (pgvector caps it at 1000)
+_EF_SEARCH_SQL = text("SELECT set_config('hnsw.ef_search', :ef, true)")
+
+
+def _ef_search_params(k: int):
+    """_EF_SEARCH_SQL params for a `k`-row ANN query, or None when the connection default already covers it."""
+    if VECTOR_INDEX != "hnsw" or k <= HNSW_EF_SEARCH:
+        return None
+    return {"ef": str(min(k, 1000))}
+
+
+def retrieve(session, profile: dict, vec, top_k: int = 10, cond_hint=None, country=None, mode=None):
+    """Candidate rows (nct_id, sim, *_FEATURE_COLS) for one embedded patient profile."""
+    sql, params = _retrieval(vec, profile, top_k, cond_hint, country, mode)
+    ef = _ef_search_params(top_k)
+    if ef:
+        session.execute(_EF_SEARCH_SQL, ef)
+    return session.execute(sql, params).fetchall()
+
+
+# one ANN probe per query vector: the LATERAL subquery is the single-patient query with q.* as its parameters,
+# so each probe still walks the vector index, but the whole batch is one round trip
+_BATCH_KNN_SQL = text(
+    """
+SELECT q.i, nn.nct_id, 1 - nn.dist AS sim,"""
+    + _FEATURE_COLS
+    + """
+FROM unnest(CAST(:vs AS vector[]), CAST(:ages AS real[]), CAST(:sexes AS text[]), CAST(:countries AS text[]))
+     WITH ORDINALITY AS q(v, age, sex, country, i)
+CROSS JOIN LATERAL (
+    SELECT nct_id, embedding <=> q.v AS dist
+    FROM trials
+    WHERE"""
+    + _PREFILTER.format(age="q.age", sex="q.sex", country="q.country")
+    + """
+    ORDER BY dist
+    LIMIT :k
+) nn
+JOIN trials t ON t.nct_id = nn.nct_id
+"""
+    + _FEATURE_JOIN
+    + """
+ORDER BY q.i, nn.dist
+"""
+)
+
+
+def _prefilter_params(profile: dict, country: str | None, cond_hint: str | None):
+    """Patient-side prefilter values; an explicit `country` wins over the patient's address."""
+    gender = (profile.get("gender") or "").upper()
+    return {
+        "age": profile.get("age"),
+        "sex": gender if gender in ("FEMALE", "MALE") else None,
+        "country": country or (profile.get("location") or {}).get("country"),
+        "cond": (cond_hint or "").strip() or None,
+    }
+
+
+_DETAILS_SQL = text("SELECT nct_id, title, eligibility->>'eligibilityCriteria' FROM trials WHERE nct_id = ANY(:ids)")
+
+
+def _details(rows):
+    return {nct_id: (title, elig_text) for nct_id, title, elig_text in rows}
+
+
+def _row_features(row):
+    nct_id, sim, raw_text, norm_text, mentions_ecog, mentions_sex_words, biomarkers = row
+    if norm_text is None:
+        return extract_trial_features(raw_text)  # ingested before trial_features existed, or stale version
+    return {"norm_text": norm_text, "mentions_ecog": mentions_ecog,
+            "mentions_sex_words": mentions_sex_words, "biomarkers": biomarkers}
+
+
+def _pool_size(top_k: int) -> int:
+    return max(top_k, MATCH_CANDIDATE_POOL)
+
+
+def _rerank(profile: dict, rows, top_k: int):
+    """
+    Stage two: rule-score every candidate row (see retrieve) from its trial features and keep the top_k by
+    RERANK_SCORE_WEIGHT * score + (1 - RERANK_SCORE_WEIGHT) * similarity; ties keep retrieval order.
+    """
+    ranked = []
+    scores = _score_features(profile, [_row_features(r) for r in rows])
+    for pos, (row, (score, breakdown, uncertain)) in enumerate(zip(rows, scores)):
+        nct_id, sim = row[0], float(row[1] or 0.0)
+        blend = RERANK_SCORE_WEIGHT * score + (1 - RERANK_SCORE_WEIGHT) * sim
+        ranked.append((-blend, pos, (nct_id, sim, score, breakdown, uncertain, blend)))
+    ranked.sort(key=lambda x: x[:2])
+    return [c for _, _, c in ranked[:top_k]]
+
+
+def _score_rows(patient_summary: str, candidates, details: dict):
+    """Results and LLM prompts for the reranked candidates in rank order; `details`: nct_id -> (title, criteria)."""
+    results, prompts = [], []
+    for nct_id, sim, score, breakdown, uncertain, blend in candidates:
+        title, elig_text = details.get(nct_id, (None, None))
+        elig_text = elig_text or ""
+        prompts.append(
+            [
                 {"role": "system", "content": SYSTEM_MATCH},
                 {
                     "role": "user",
@@ -133,10 +398,7 @@ def match_for_patient_bundle(
                     ),
                 },
             ]
-            llm_expl = generate(messages)
-        except Exception:
-            llm_expl = None  # keep going even if LLM isn't up
-
+        )
         results.append(
             {
                 "nct_id": nct_id,
@@ -144,10 +406,262 @@ def match_for_patient_bundle(
                 "score": score,
                 "score_breakdown": breakdown,
                 "uncertain_criteria": uncertain,
-                "vector_similarity": round(float(sim or 0.0), 3),
-                "llm_explanation": llm_expl,
+                "vector_similarity": round(sim, 3),
+                "rerank_score": round(blend, 3),
+                "llm_explanation": None,
             }
         )
+    return results, prompts
+
+
+def _fill_explanations(results, keys, cached, todo, fresh):
+    explanations = dict(cached)
+    explanations.update({keys[i]: expl for i, expl in zip(todo, fresh)})
+    for r, k in zip(results, keys):
+        r["llm_explanation"] = explanations.get(k)
+
+
+def match_for_patient_bundle(
+    session,
+    bundle: dict,
+    notes: str,
+    top_k: int = 10,
+    cond_hint: str | None = None,
+    country: str | None = "United States",
+    llm_deadline_s: float | None = None,
+    explain: bool = True,
+):
+    """
+    Build a patient profile, embed it, vector-retrieve candidate trials, score, and (optionally) LLM-rationalize.
+    Retrieval only ranks trials that admit the patient's age and sex, recruit in `country` (else the patient's
+    own country) and, with `cond_hint`, list a matching condition; RETRIEVAL_MODE=hybrid fuses cosine and
+    full-text rank. The MATCH_CANDIDATE_POOL nearest candidates are rule-scored and reranked before the
+    top_k are kept, so only those reach the LLM. LLM calls run concurrently (capped by LLM_CONCURRENCY) and are bounded by `llm_deadline_s`;
+    `explain=False` skips them.
+    """
+    profile = build_patient_profile(bundle, notes)
+    patient_summary = summarize_profile(profile)
+
+    # Embed summary; the numpy array is bound as a binary vector parameter (adapter registered in services.db)
+    vec = np.asarray(embed_texts([patient_summary])[0], dtype=np.float32)  # (384,)
+
+    # Stage one: a cheap candidate pool (ids + stored scoring features) by prefiltered vector similarity using
+    # pgvector's <=> operator (fused with full-text rank in hybrid mode)
+    rows = retrieve(session, profile, vec, _pool_size(top_k), cond_hint, country)
+    # Stage two: rule-score the whole pool, rerank, and fetch titles + criteria for the survivors only
+    candidates = _rerank(profile, rows, top_k)
+    details = _details(session.execute(_DETAILS_SQL, {"ids": [c[0] for c in candidates]}))
+    results, prompts = _score_rows(patient_summary, candidates, details)
+    if explain:
+        _explain(session, results, prompts, llm_deadline_s)
+    return results
+
+
+def _explain(session, results, prompts, llm_deadline_s):
+    # Reuse cached rationales, then ask the local LLM for the rest at once;
+    # whatever misses the deadline stays None
+    keys = [rationale_cache.cache_key(m) for m in prompts]
+    cached = rationale_cache.get_many(session, keys)
+    todo = [i for i, k in enumerate(keys) if k not in cached]
+    fresh = generate_many([prompts[i] for i in todo], deadline_s=llm_deadline_s) if todo else []
+    rationale_cache.put_many(session, {keys[i]: expl for i, expl in zip(todo, fresh)})
+    _fill_explanations(results, keys, cached, todo, fresh)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_batch_matches(
+    session,
+    patients,
+    top_k: int = 10,
+    cond_hint: str | None = None,
+    country: str | None = "United States",
+    llm_deadline_s: float | None = None,
+    explain: bool = False,
+    chunk_size: int | None = None,
+):
+    """
+    Match many patients. `patients` is an iterable of (bundle, notes), consumed `chunk_size` at a time:
+    every chunk is embedded in one embed_texts call and retrieved in one SQL statement (vector mode only;
+    hybrid fusion is not batched), then scored (and optionally LLM-rationalized) patient by patient.
+    Yields (index, results, error) in input order as each patient completes; a patient whose bundle fails
+    to parse yields its error instead of stopping the batch. Chunks shrink so that one holds at most
+    MATCH_BATCH_MAX_ROWS candidate rows (patients x candidate pool).
+    """
+    offset = 0
+    chunk_size = min(chunk_size or MATCH_BATCH_CHUNK, MATCH_BATCH_MAX_ROWS // _pool_size(top_k))
+    for chunk in _chunks(patients, max(1, chunk_size)):
+        profiles, errors = {}, {}
+        for j, (bundle, notes) in enumerate(chunk):
+            try:
+                if isinstance(bundle, ValueError):
+                    raise bundle  # an input line that failed to parse (services.batch)
+                if not isinstance(bundle, dict):
+                    raise ValueError("patient_fhir: expected a FHIR bundle object")
+                profile = build_patient_profile(bundle, notes or "")
+                profiles[j] = (profile, summarize_profile(profile))
+            except Exception as e:
+                errors[j] = f"{type(e).__name__}: {e}"
 
+        rows_by_patient = {}
+        if profiles:
+            order = sorted(profiles)
+            vecs = embed_texts([profiles[j][1] for j in order])
+            filters = [_prefilter_params(profiles[j][0], country, cond_hint) for j in order]
+            params = {
+                "vs": [np.asarray(v, dtype=np.float32) for v in vecs],
+                "ages": [f["age"] for f in filters],
+                "sexes": [f["sex"] for f in filters],
+                "countries": [f["country"] for f in filters],
+                "cond": filters[0]["cond"],
+                "k": _pool_size(top_k),
+                "fv": FEATURES_VERSION,
+            }
+            ef = _ef_search_params(params["k"])
+            if ef:
+                session.execute(_EF_SEARCH_SQL, ef)
+            for i, *row in session.execute(_BATCH_KNN_SQL, params):
+                rows_by_patient.setdefault(order[i - 1], []).append(tuple(row))
+
+        candidates = {j: _rerank(profiles[j][0], rows_by_patient.get(j, []), top_k) for j in profiles}
+        ids = sorted({c[0] for cs in candidates.values() for c in cs})
+        details = _details(session.execute(_DETAILS_SQL, {"ids": ids})) if ids else {}
+
+        for j in range(len(chunk)):
+            if j in errors:
+                yield offset + j, None, errors[j]
+                continue
+            results, prompts = _score_rows(profiles[j][1], candidates[j], details)
+            if explain:
+                _explain(session, results, prompts, llm_deadline_s)
+            yield offset + j, results, None
+        offset += len(chunk)
+
+
+async def _aretrieve(session, bundle, notes, top_k, cond_hint, country):
+    profile = build_patient_profile(bundle, notes)
+    patient_summary = summarize_profile(profile)
+
+    loop = asyncio.get_running_loop()
+    vecs = await loop.run_in_executor(None, embed_texts, [patient_summary])
+    vec = np.asarray(vecs[0], dtype=np.float32)
+
+    sql, params = _retrieval(vec, profile, _pool_size(top_k), cond_hint, country, None)
+    ef = _ef_search_params(params["k"])
+    if ef:
+        await session.execute(_EF_SEARCH_SQL, ef)
+    rows = (await session.execute(sql, params)).fetchall()
+    candidates = await loop.run_in_executor(None, _rerank, profile, rows, top_k)
+    details = _details(await session.execute(_DETAILS_SQL, {"ids": [c[0] for c in candidates]}))
+    return _score_rows(patient_summary, candidates, details)
+
+
+async def amatch_for_patient_bundle(
+    session,
+    bundle: dict,
+    notes: str,
+    top_k: int = 10,
+    cond_hint: str | None = None,
+    country: str | None = "United States",
+    llm_deadline_s: float | None = None,
+    explain: bool = True,
+):
+    """
+    Async variant of match_for_patient_bundle for an AsyncSession (services.db.get_async_session).
+    Embedding and reranking run in the default executor; SQL and LLM calls are awaited, so one worker can hold
+    many matches open while they wait on Postgres and Ollama.
+    """
+    results, prompts = await _aretrieve(session, bundle, notes, top_k, cond_hint, country)
+    if not explain:
+        return results
+
+    keys = [rationale_cache.cache_key(m) for m in prompts]
+    cached = await rationale_cache.aget_many(session, keys)
+    todo = [i for i, k in enumerate(keys) if k not in cached]
+    fresh = await agenerate_many([prompts[i] for i in todo], deadline_s=llm_deadline_s) if todo else []
+    await rationale_cache.aput_many(session, {keys[i]: expl for i, expl in zip(todo, fresh)})
+    _fill_explanations(results, keys, cached, todo, fresh)
     return results
 
+
+async def astream_match_for_patient_bundle(
+    session,
+    bundle: dict,
+    notes: str,
+    top_k: int = 10,
+    cond_hint: str | None = None,
+    country: str | None = "United States",
+    llm_deadline_s: float | None = None,
+    explain: bool = True,
+    tokens: bool = False,
+):
+    """
+    Streaming variant of amatch_for_patient_bundle. Yields event dicts:
+      {"event": "matches", "matches": [...]}  retrieval + rule scores (cached rationales already filled), first
+      {"event": "token", "nct_id", "delta"}    rationale text as Ollama generates it (only with tokens=True)
+      {"event": "explanation", "nct_id", "llm_explanation"}  one per trial as its rationale completes
+      {"event": "done", "missed": [nct_id, ...]}  trials whose rationale failed or missed the deadline
+    """
+    results, prompts = await _aretrieve(session, bundle, notes, top_k, cond_hint, country)
+    if not explain:
+        yield {"event": "matches", "matches": results}
+        yield {"event": "done", "missed": []}
+        return
+
+    keys = [rationale_cache.cache_key(m) for m in prompts]
+    cached = await rationale_cache.aget_many(session, keys)
+    todo = [i for i, k in enumerate(keys) if k not in cached]
+    _fill_explanations(results, keys, cached, [], [])
+    yield {"event": "matches", "matches": results}
+
+    queue = asyncio.Queue()
+
+    async def explain_one(i):
+        nct_id, expl = results[i]["nct_id"], None
+        try:
+            if tokens:
+                parts = []
+                async for delta in agenerate_stream(prompts[i]):
+                    parts.append(delta)
+                    await queue.put({"event": "token", "nct_id": nct_id, "delta": delta})
+                expl = "".join(parts)
+            else:
+                expl = await agenerate(prompts[i])
+        except Exception:
+            pass
+        await queue.put((i, expl))
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (LLM_DEADLINE_S if llm_deadline_s is None else llm_deadline_s)
+    tasks = [asyncio.create_task(explain_one(i)) for i in todo]
+    fresh, left = {}, len(tasks)
+    try:
+        while left:
+            try:
+                ev = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+            if isinstance(ev, dict):
+                yield ev
+                continue
+            i, expl = ev
+            left -= 1
+            results[i]["llm_explanation"] = expl
+            if expl:
+                fresh[keys[i]] = expl
+                yield {"event": "explanation", "nct_id": results[i]["nct_id"], "llm_explanation": expl}
+    finally:
+        # also runs when the client disconnects mid-stream
+        for t in tasks:
+            t.cancel()
+    await rationale_cache.aput_many(session, fresh)
+    yield {"event": "done", "missed": [results[i]["nct_id"] for i in todo if not results[i]["llm_explanation"]]}
@@ -0,0 +1,116 @@
+
+import hashlib, json, threading
+from sqlalchemy import text
+from ..config import (
+    LLM_MODEL,
+    RATIONALE_CACHE_ENABLED,
+    RATIONALE_CACHE_TTL_HOURS,
+    RATIONALE_CACHE_MAX_ROWS,
+)
+from ..llm.prompts import PROMPT_VERSION
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0}
+_unswept = 0  # rows written since this process last evicted
+_SWEEP_EVERY = 500
+
+_GET_SQL = text("""
+UPDATE rationale_cache SET last_used_at = now()
+WHERE key = ANY(:keys) AND created_at > now() - make_interval(secs => :ttl)
+RETURNING key, response
+""")
+_PUT_SQL = text("""
+INSERT INTO rationale_cache (key, model, prompt_version, response)
+VALUES (:key, :model, :prompt_version, :response)
+ON CONFLICT (key) DO UPDATE SET
+  response = EXCLUDED.response,
+  created_at = now(),
+  last_used_at = now()
+""")
+_EXPIRE_SQL = text("DELETE FROM rationale_cache WHERE created_at <= now() - make_interval(secs => :ttl)")
+_TRIM_SQL = text("""
+DELETE FROM rationale_cache WHERE key IN (
+    SELECT key FROM rationale_cache ORDER BY last_used_at DESC OFFSET :max_rows
+)
+""")
+
+def cache_key(messages) -> str:
+    blob = json.dumps({"model": LLM_MODEL, "prompt_version": PROMPT_VERSION, "messages": messages}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _count(name, n):
+    with _lock:
+        _stats[name] += n
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_stats)
+    total = out["hits"] + out["misses"]
+    out["hit_rate"] = round(out["hits"] / total, 3) if total else None
+    out["enabled"] = RATIONALE_CACHE_ENABLED
+    return out
+
+def _get_params(keys):
+    return {"keys": list(keys), "ttl": RATIONALE_CACHE_TTL_HOURS * 3600}
+
+def _record_get(keys, rows):
+    found = {k: v for k, v in rows}
+    _count("hits", len(found))
+    _count("misses", len(set(keys)) - len(found))
+    return found
+
+def _sweep_due(n):
+    """True once every _SWEEP_EVERY written rows; expiry and trimming sort/scan the table, so not on every put."""
+    global _unswept
+    with _lock:
+        _unswept += n
+        if _unswept < _SWEEP_EVERY:
+            return False
+        _unswept = 0
+        return True
+
+def _put_params(items):
+    return [{"key": k, "model": LLM_MODEL, "prompt_version": PROMPT_VERSION, "response": v} for k, v in items.items()]
+
+def get_many(session, keys):
+    """Return {key: rationale} for the cached, unexpired entries among `keys`."""
+    if not RATIONALE_CACHE_ENABLED or not keys:
+        return {}
+    rows = session.execute(_GET_SQL, _get_params(keys)).fetchall()
+    session.commit()
+    return _record_get(keys, rows)
+
+def put_many(session, items):
+    """Store {key: rationale}; every few hundred writes, evict expired entries and anything beyond
+    RATIONALE_CACHE_MAX_ROWS (reads already ignore expired rows)."""
+    items = {k: v for k, v in items.items() if v}
+    if not RATIONALE_CACHE_ENABLED or not items:
+        return
+    for params in _put_params(items):
+        session.execute(_PUT_SQL, params)
+    if _sweep_due(len(items)):
+        session.execute(_EXPIRE_SQL, {"ttl": RATIONALE_CACHE_TTL_HOURS * 3600})
+        session.execute(_TRIM_SQL, {"max_rows": RATIONALE_CACHE_MAX_ROWS})
+    session.commit()
+    _count("writes", len(items))
+
+async def aget_many(session, keys):
+    """get_many for an AsyncSession."""
+    if not RATIONALE_CACHE_ENABLED or not keys:
+        return {}
+    rows = (await session.execute(_GET_SQL, _get_params(keys))).fetchall()
+    await session.commit()
+    return _record_get(keys, rows)
+
+async def aput_many(session, items):
+    """put_many for an AsyncSession."""
+    items = {k: v for k, v in items.items() if v}
+    if not RATIONALE_CACHE_ENABLED or not items:
+        return
+    for params in _put_params(items):
+        await session.execute(_PUT_SQL, params)
+    if _sweep_due(len(items)):
+        await session.execute(_EXPIRE_SQL, {"ttl": RATIONALE_CACHE_TTL_HOURS * 3600})
+        await session.execute(_TRIM_SQL, {"max_rows": RATIONALE_CACHE_MAX_ROWS})
+    await session.commit()
+    _count("writes", len(items))
@@ -0,0 +1,143 @@
+
+import multiprocessing, threading, time
+from sqlalchemy.orm import sessionmaker
+from ..config import TRIAL_REFRESH_INTERVAL_MIN, TRIAL_REFRESH_WORKER
+
+def _sync_job():
+    """One incremental sync with its own engine, so it can run in a child process."""
+    from .db import make_engine
+    from .trials import sync_trials_incremental
+
+    engine = make_engine()
+    try:
+        with sessionmaker(bind=engine, future=True)() as s:
+            return sync_trials_incremental(s)
+    finally:
+        engine.dispose()
+
+def _sync_child(conn):
+    """Child-process entry point: run one sync and send ("ok", stats) or ("error", message) back."""
+    try:
+        conn.send(("ok", _sync_job()))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+class TrialRefresher:
+    """
+    Runs incremental CT.gov syncs every `interval_min` minutes on a daemon thread. With worker="process"
+    each sync (fetch + SentenceTransformer encode + upsert) runs in a spawned child process, so the encode
+    does not compete with request handling for this process's GIL and CPU threads, and stop() terminates
+    a sync in progress instead of waiting for it (safe: the high-water mark only covers committed pages).
+    Every uvicorn worker process starts its own refresher; with more than one worker, set
+    TRIAL_REFRESH_INTERVAL_MIN=0 and sync from cron (load_ctgov --incremental), or the syncs race on
+    the same rows and mark.
+    """
+    def __init__(self, interval_min=None, worker=None, on_success=None):
+        self.interval_s = 60 * (TRIAL_REFRESH_INTERVAL_MIN if interval_min is None else interval_min)
+        self.worker = worker or TRIAL_REFRESH_WORKER
+        self.on_success = on_success
+        self._stop = threading.Event()
+        self._thread = None
+        self._proc = None
+        self._lock = threading.Lock()
+        self._state = {
+            "enabled": self.interval_s > 0,
+            "interval_min": self.interval_s / 60,
+            "worker": self.worker,
+            "running": False,
+            "runs": 0,
+            "last_started_at": None,
+            "last_finished_at": None,
+            "last_duration_s": None,
+            "last_rows_changed": None,
+            "last_stats": None,
+            "last_error": None,
+            "next_run_at": None,
+        }
+
+    def _update(self, **kw):
+        with self._lock:
+            self._state.update(kw)
+
+    def status(self):
+        with self._lock:
+            return dict(self._state)
+
+    def start(self):
+        if self.interval_s <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="trial-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        with self._lock:
+            proc = self._proc
+        if proc is not None and proc.is_alive():
+            proc.terminate()
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.kill()
+
+    def _run_in_process(self):
+        # spawn, not fork: the server process has live threads and DB connections
+        ctx = multiprocessing.get_context("spawn")
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_sync_child, args=(send,), name="trial-sync", daemon=True)
+        with self._lock:
+            if not self._stop.is_set():
+                self._proc = proc
+                proc.start()
+        send.close()
+        if self._proc is not proc:
+            recv.close()
+            raise RuntimeError("refresher stopped")
+        try:
+            while not recv.poll(0.5):
+                if not proc.is_alive() or self._stop.is_set():
+                    break
+            try:
+                status, payload = recv.recv() if recv.poll() else (None, None)
+            except EOFError:  # child died without reporting
+                status = None
+            if status is None:
+                if self._stop.is_set():
+                    raise RuntimeError("sync process terminated by stop()")
+                proc.join(1)
+                raise RuntimeError(f"sync process exited with code {proc.exitcode}")
+            if status == "error":
+                raise RuntimeError(payload)
+            return payload
+        finally:
+            recv.close()
+            proc.join(1)
+            with self._lock:
+                self._proc = None
+
+    def run_once(self):
+        started = time.time()
+        self._update(running=True, last_started_at=started)
+        try:
+            if self.worker == "process":
+                stats = self._run_in_process()
+            else:
+                stats = _sync_job()
+            self._update(last_stats=stats, last_rows_changed=stats["written"] + stats["removed"], last_error=None)
+            if self.on_success:
+                self.on_success(stats)
+        except Exception as e:
+            self._update(last_error=f"{type(e).__name__}: {e}")
+        finally:
+            finished = time.time()
+            with self._lock:
+                self._state.update(running=False, last_finished_at=finished,
+                                   last_duration_s=round(finished - started, 3), runs=self._state["runs"] + 1)
+
+    def _loop(self):
+        while True:
+            self._update(next_run_at=time.time() + self.interval_s)
+            if self._stop.wait(self.interval_s):
+                return
+            self.run_once()
@@ -1,9 +1,142 @@
 
+import hashlib, json, threading, time
 from sqlalchemy import text
-from ..data.ctgov_ingest import fetch_trials, upsert_trials
+from ..config import DEFAULT_STATUSES, TRIAL_SYNC_COND, TRIAL_SYNC_COUNTRY, TRIAL_SYNC_MAX_PAGES
+from ..data.ctgov_ingest import (
+    fetch_trials,
+    upsert_trials,
+    iter_trial_pages,
+    ingest_pages,
+    study_status,
+    study_last_update,
+)
+
+HWM_KEY = "ctgov_last_update_post_date"
+
+def hwm_key(cond=None, terms=None, country=None, state=None, statuses=None):
+    """sync_state name of the high-water mark for one query scope, so different scopes never share a mark."""
+    scope = {"cond": cond or None, "terms": terms or None, "country": country or None,
+             "state": (state or None) if country else None, "statuses": sorted(statuses or DEFAULT_STATUSES)}
+    return f"{HWM_KEY}:{hashlib.sha256(json.dumps(scope, sort_keys=True).encode('utf-8')).hexdigest()[:16]}"
+
+class CorpusState:
+    """
+    In-process readiness of the trials table, decided once at startup (or by a background loader)
+    so request handlers never count rows or trigger an ingest themselves.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "unknown"  # unknown | bootstrapping | ready | error
+        self.error = None
+        self.changed_at = time.time()
+
+    def set(self, status, error=None):
+        with self._lock:
+            self.status, self.error, self.changed_at = status, error, time.time()
+
+    def is_ready(self):
+        return self.status == "ready"
+
+    def snapshot(self):
+        with self._lock:
+            return {"status": self.status, "error": self.error, "changed_at": self.changed_at}
+
+corpus = CorpusState()
+
+def _has_trials(session):
+    # EXISTS stops at the first row, unlike count(*) which scans the table
+    return session.execute(text("SELECT EXISTS (SELECT 1 FROM trials)")).scalar_one()
+
+def _bootstrap(session_factory):
+    try:
+        with session_factory() as s:
+            refresh_trials_if_needed(s)
+        corpus.set("ready")
+    except Exception as e:
+        corpus.set("error", str(e))
+
+def init_corpus_state(session_factory, background=True):
+    """
+    Decide corpus readiness once. An empty table is loaded on a background thread (state "bootstrapping")
+    so startup and match endpoints never block on CT.gov + embedding.
+    """
+    with session_factory() as s:
+        ready = _has_trials(s)
+    if ready:
+        corpus.set("ready")
+        return
+    corpus.set("bootstrapping")
+    if background:
+        threading.Thread(target=_bootstrap, args=(session_factory,), name="corpus-bootstrap", daemon=True).start()
+    else:
+        _bootstrap(session_factory)
 
 def refresh_trials_if_needed(session, force=False):
-    n = session.execute(text("SELECT count(*) FROM trials")).scalar_one()
-    if n == 0 or force:
-        trials = fetch_trials(cond="lymphoma", country="United States", max_pages=1)
+    if force or not _has_trials(session):
+        trials = fetch_trials(cond=TRIAL_SYNC_COND, country=TRIAL_SYNC_COUNTRY, max_pages=1)
         upsert_trials(session, trials)
+
+def get_high_water_mark(session, key):
+    """Last synced lastUpdatePostDate for the scope `key` (see hwm_key), or None until a sync has recorded one."""
+    return session.execute(text("SELECT value FROM sync_state WHERE name = :n"), {"n": key}).scalar()
+
+def set_high_water_mark(session, key, value):
+    session.execute(text("""
+    INSERT INTO sync_state (name, value) VALUES (:n, :v)
+    ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+    """), {"n": key, "v": value})
+    session.commit()
+
+def sync_trials_incremental(session, cond=None, terms=None, country=None, state=None, statuses=None,
+                            since=None, page_size=100, max_pages=None, checkpoint_path=None, bulk=False):
+    """
+    Delta sync: fetch only studies updated since the high-water mark (any status), upsert the ones still in
+    `statuses`, delete the ones that left them, then advance the mark. Without a mark this is a full load.
+    Pages come oldest-first in both cases and the mark only advances past pages that are committed, so a
+    run capped by `max_pages` (or interrupted) picks up where it stopped next time. Each query scope
+    (cond/terms/location/statuses) keeps its own mark; `checkpoint_path` must not be shared with other loads. The mark is inclusive
+    (day granularity); re-seen studies are cheap thanks to the content-hash skip.
+    """
+    cond = TRIAL_SYNC_COND if cond is None else cond
+    country = TRIAL_SYNC_COUNTRY if country is None else country
+    statuses = [s.upper() for s in (statuses or DEFAULT_STATUSES)]
+    key = hwm_key(cond, terms, country, state, statuses)
+    since = since or get_high_water_mark(session, key)
+    if since and len(since) < 10:
+        since = f"{since[:7]}-01"
+    seen = {"hwm": since, "complete": False}
+
+    def committed(ack, newest):
+        def done():
+            ack()
+            if newest and (seen["hwm"] is None or newest > seen["hwm"]):
+                seen["hwm"] = newest
+                set_high_water_mark(session, key, newest)
+            seen["complete"] = ack.last_page
+        return done
+
+    def active_pages():
+        for studies, ack in iter_trial_pages(cond=cond, terms=terms, country=country, state=state,
+                                             statuses=statuses, page_size=page_size,
+                                             max_pages=max_pages or TRIAL_SYNC_MAX_PAGES,
+                                             checkpoint_path=checkpoint_path, ack_pages=True, updated_since=since,
+                                             oldest_first=True):
+            keep, gone, newest = [], [], None
+            for t in studies:
+                d = study_last_update(t)
+                if d and (newest is None or d > newest):
+                    newest = d
+                if since and study_status(t) not in statuses:
+                    nct_id = t.get("protocolSection", {}).get("identificationModule", {}).get("nctId")
+                    if nct_id:
+                        gone.append(nct_id)
+                else:
+                    keep.append(t)
+            # departed ids are deleted in the same transaction as the batch that carries this page's ack
+            yield keep, committed(ack, newest), gone
+
+    stats = ingest_pages(session, active_pages(), bulk=bulk)
+    stats["since"] = since
+    stats["high_water_mark"] = seen["hwm"]
+    stats["complete"] = seen["complete"]
+    return stats